@@ -0,0 +1,132 @@
+import re
+import sys
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from tool_selector import HashingEmbedder
+
+
+def normalize_message(text: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace so trivial variants share a key"""
+    text = re.sub(r"['’]", "", (text or "").lower())
+    return " ".join(re.findall(r"[a-z0-9]+", text))
+
+
+def arguments_in_message(normalized: str, tools_used: list) -> bool:
+    """Whether every tool argument can be read off the message itself.
+
+    Answers whose tool arguments came from earlier turns (e.g. "what about
+    ontario?") depend on the conversation, not just the question, and must
+    not be replayed to other users.
+    """
+    for tool in tools_used:
+        for value in (tool.get("parameters") or {}).values():
+            if isinstance(value, (dict, list)):
+                return False
+            if normalize_message(str(value)) not in normalized:
+                return False
+    return True
+
+
+class CachedAnswer:
+    __slots__ = ("answer", "tools_used", "argument_free", "created_at", "expires_at", "size", "vector")
+
+    def __init__(self, answer: str, tools_used: list, ttl: float, vector: np.ndarray):
+        self.answer = answer
+        self.tools_used = tools_used
+        self.argument_free = not any(tool.get("parameters") for tool in tools_used)
+        self.created_at = time.time()
+        self.expires_at = time.monotonic() + ttl
+        self.vector = vector
+        self.size = sys.getsizeof(answer) + vector.nbytes + 256 * (1 + len(tools_used))
+
+
+class AnswerCache:
+    """Worker-wide cache of final answers to tool-backed questions.
+
+    Keyed by the tool catalog fingerprint and the normalized user message.
+    A lookup first tries the exact key, then the most similar cached
+    question for the same catalog, if its cosine similarity reaches
+    `similarity`. Near-duplicates only match answers whose tool calls took
+    no arguments: a question differing in one word ("canada" vs "mexico")
+    is nearly identical but needs other arguments, so answers built from
+    arguments are only served for the exact question. Each answer expires
+    with the shortest TTL of the tools that produced it. Entries are evicted least recently used first once
+    their estimated size exceeds `max_bytes`.
+    """
+
+    def __init__(self, max_bytes: int = 8 * 1024 * 1024, similarity: float = 0.92, embedder=None):
+        self.max_bytes = max_bytes
+        self.similarity = similarity
+        self.embedder = embedder or HashingEmbedder()
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.bytes = 0
+        self._entries = OrderedDict()  # (catalog, normalized message) -> CachedAnswer
+        self._matrices = {}            # catalog -> (keys, vector matrix), rebuilt after changes
+
+    def get(self, catalog: str, message: str) -> CachedAnswer:
+        """Return a live cached answer for `message`, or None"""
+        normalized = normalize_message(message)
+        if not normalized:
+            return None
+        key = (catalog, normalized)
+        entry = self._live(key)
+        if entry is not None:
+            self.hits += 1
+            return entry
+
+        if self.similarity < 1.0:
+            entry = self._most_similar(catalog, normalized)
+            if entry is not None:
+                self.similar_hits += 1
+                return entry
+        self.misses += 1
+        return None
+
+    def put(self, catalog: str, message: str, answer: str, tools_used: list, ttl: float):
+        """Cache an answer for `ttl` seconds"""
+        normalized = normalize_message(message)
+        if not normalized or not ttl or not answer:
+            return
+        key = (catalog, normalized)
+        self._remove(key)
+        entry = CachedAnswer(answer, tools_used, ttl, self.embedder.embed([normalized])[0])
+        self._entries[key] = entry
+        self.bytes += entry.size
+        self._matrices.pop(catalog, None)
+        while self.bytes > self.max_bytes and self._entries:
+            self._remove(next(iter(self._entries)))
+
+    def _live(self, key: tuple) -> CachedAnswer:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at <= time.monotonic():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _most_similar(self, catalog: str, normalized: str) -> CachedAnswer:
+        cached = self._matrices.get(catalog)
+        if cached is None:
+            keys = [key for key, entry in self._entries.items() if key[0] == catalog and entry.argument_free]
+            if not keys:
+                return None
+            cached = self._matrices[catalog] = (keys, np.stack([self._entries[key].vector for key in keys]))
+        keys, matrix = cached
+        scores = matrix @ self.embedder.embed([normalized])[0]
+        best = int(np.argmax(scores))
+        if scores[best] < self.similarity:
+            return None
+        return self._live(keys[best])
+
+    def _remove(self, key: tuple):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry.size
+            self._matrices.pop(key[0], None)
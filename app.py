@@ -1,48 +1,225 @@
+from startup import health_endpoint, startup_state
 import os
 import chainlit as cl
+from chainlit.mcp import SseMcpConnection
 from openai import AsyncAzureOpenAI
 from mcp import ClientSession
+from mcp.client.sse import sse_client
 import json
 import asyncio
+import hashlib
+import tempfile
+import time
+import uuid
+from collections import Counter
+from streaming import stream_completion
+from tool_registry import ToolRegistry, to_openai_schema
+from catalog_cache import CatalogCache, is_private_scope, result_scope
+from history import ConversationHistory, get_encoding
+from session_store import create_session_store, pack, unpack
+from tool_cache import ToolResultCache, parse_tool_ttls
+from intent_router import IntentRouter, router_stats
+from tool_selector import ToolSelector
+from answer_cache import AnswerCache, arguments_in_message, normalize_message
+from tool_results import discard_spill, process_tool_result, prompt_text, sweep_spill_dir
+from tool_executor import ToolExecutor
+from prefetch import ToolPrefetcher
+from llm_gateway import LLMGateway, build_http_client
+from metrics import TURNS, logger, metrics_endpoint, mount_route, record_overlap, record_usage, register_stats, span, tool_span
+from config import AzureOpenAIConfig, WarmupConfig
+from chainlit.server import app as chainlit_app
 
-client = AsyncAzureOpenAI(
-    api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-    api_version="2025-01-01-preview",
-    azure_endpoint="https://platform-core-hackathon-ndtibpy.openai.azure.com"
+# Typed settings from the environment (AZURE_OPENAI_*, LLM_*, WARMUP_*, MCP_WARMUP_SERVERS)
+azure_config = AzureOpenAIConfig.from_env()
+warmup_config = WarmupConfig.from_env()
+startup_state.problems.extend(azure_config.problems())
+
+_llm = None
+
+def get_llm() -> LLMGateway:
+    """The worker's LLM gateway, built on first use (warmup or the first request)"""
+    global _llm
+    if _llm is None:
+        # Retries are handled by the gateway (rate-limit aware), not by the SDK
+        client = AsyncAzureOpenAI(
+            api_key=azure_config.api_key,
+            api_version=azure_config.api_version,
+            azure_endpoint=azure_config.endpoint,
+            http_client=build_http_client(
+                max_connections=azure_config.max_connections,
+                max_keepalive=azure_config.max_keepalive
+            ),
+            max_retries=0
+        )
+        _llm = LLMGateway(
+            client,
+            max_in_flight=azure_config.max_in_flight,
+            max_retries=azure_config.max_retries,
+            hedge=azure_config.hedge
+        )
+    return _llm
+
+# Token budget for the verbatim conversation history sent with every request;
+# older turns are folded into a running summary in the background
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "6000"))
+HISTORY_SUMMARY_MAX_TOKENS = 400
+
+# Where conversation state lives between turns: in this process by default, or
+# on a Redis-protocol server (SESSION_STORE_URL=redis://...) so any worker or
+# instance can pick up a session and restarts keep conversations (the
+# in-process copy is dropped when the chat ends)
+session_store = create_session_store(os.getenv("SESSION_STORE_URL", ""))
+SESSION_STATE_TTL = float(os.getenv("SESSION_STATE_TTL", "86400"))
+
+# Worker-wide cache of tool results. Tools are cached when given a TTL in
+# TOOL_CACHE_TTLS ("tool=seconds,...") or annotated read-only by their server;
+# TOOL_CACHE_DENY lists side-effecting tools that must always hit the server.
+tool_cache = ToolResultCache(
+    max_entries=int(os.getenv("TOOL_CACHE_MAX_ENTRIES", "512")),
+    default_ttl=float(os.getenv("TOOL_CACHE_DEFAULT_TTL", "60")),
+    tool_ttls=parse_tool_ttls(os.getenv("TOOL_CACHE_TTLS", "")),
+    deny={name.strip() for name in os.getenv("TOOL_CACHE_DENY", "").split(",") if name.strip()}
+)
+
+# Process-wide, disk-backed MCP tool catalogs: known servers' tools are served
+# on connect and re-listed in the background once older than CATALOG_CACHE_TTL
+catalog_cache = CatalogCache(
+    os.getenv("CATALOG_CACHE_DIR") or os.path.join(tempfile.gettempdir(), "chainlit-tool-catalogs"),
+    fresh_seconds=float(os.getenv("CATALOG_CACHE_TTL", "300")),
+    store=session_store if session_store.shared else None
+)
+
+# Worker-wide guard around MCP tool calls: bounded concurrency per server,
+# timeouts learned from observed latencies (capped at TOOL_TIMEOUT_MAX) and a
+# circuit breaker that fails fast and hides an unhealthy server's tools
+tool_executor = ToolExecutor(
+    max_per_server=int(os.getenv("MCP_MAX_CONCURRENCY_PER_SERVER", "8")),
+    min_timeout=float(os.getenv("TOOL_TIMEOUT_MIN", "2")),
+    max_timeout=float(os.getenv("TOOL_TIMEOUT_MAX", "30")),
+    failure_threshold=int(os.getenv("TOOL_BREAKER_FAILURES", "3")),
+    reset_seconds=float(os.getenv("TOOL_BREAKER_RESET", "30"))
 )
 
+# Sessions connected to each server identity; breakers, learned timeouts and
+# in-memory catalogs of a server are dropped once no session uses it
+connected_servers = Counter()
+
+# Token cap for a single tool result in the synthesis prompt; larger results are
+# spilled to a file attached in the UI and map-reduce summarized chunk by chunk
+TOOL_RESULT_MAX_TOKENS = int(os.getenv("TOOL_RESULT_MAX_TOKENS", "3000"))
+TOOL_RESULT_CHUNK_TOKENS = int(os.getenv("TOOL_RESULT_CHUNK_TOKENS", "4000"))
+TOOL_RESULT_SUMMARY_MAX_TOKENS = 500
+
+# Minimum TF-IDF score for dispatching a tool without asking the model first
+INTENT_ROUTER_MIN_SCORE = float(os.getenv("INTENT_ROUTER_MIN_SCORE", "0.3"))
+
+# Large catalogs: only the TOOL_SELECTION_TOP_K tools most similar to the message
+# are put in the prompt and offered to the model (0 offers every tool)
+TOOL_SELECTION_TOP_K = int(os.getenv("TOOL_SELECTION_TOP_K", "12"))
+
+# Opt-in cache of final answers to tool-backed questions, shared by every session
+# in the worker; near-duplicates match at ANSWER_CACHE_SIMILARITY cosine similarity.
+# Only answers produced without earlier conversation context are stored.
+answer_cache = None
+if os.getenv("ANSWER_CACHE_ENABLED", "false").lower() == "true":
+    answer_cache = AnswerCache(
+        max_bytes=int(os.getenv("ANSWER_CACHE_MAX_BYTES", str(8 * 1024 * 1024))),
+        similarity=float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.92"))
+    )
+
+# Speculative prefetch of likely argument-free, cacheable tools while the first
+# completion streams (0 disables); candidates need this TF-IDF score
+TOOL_PREFETCH_MAX = int(os.getenv("TOOL_PREFETCH_MAX", "2"))
+TOOL_PREFETCH_MIN_SCORE = float(os.getenv("TOOL_PREFETCH_MIN_SCORE", "0.1"))
+
+# Prometheus scrape endpoint plus the live counters components already keep;
+# /health is the readiness probe used by Docker, docker-compose and ECS
+mount_route(chainlit_app, "/metrics", metrics_endpoint)
+mount_route(chainlit_app, "/health", health_endpoint)
+register_stats("tool_cache", lambda: {"hits": tool_cache.hits, "misses": tool_cache.misses, "coalesced": tool_cache.coalesced})
+register_stats("intent_router", lambda: {"considered": router_stats.considered, "routed": router_stats.routed})
+register_stats("catalog_cache", lambda: {"hits": catalog_cache.hits, "misses": catalog_cache.misses, "refreshes": catalog_cache.refreshes})
+register_stats("tool_executor", lambda: {"in_flight": tool_executor.in_flight, "timeouts": tool_executor.timeouts, "rejected": tool_executor.rejected, "open_circuits": len(tool_executor.open_servers())})
+if answer_cache is not None:
+    register_stats("answer_cache", lambda: {"hits": answer_cache.hits, "similar_hits": answer_cache.similar_hits, "misses": answer_cache.misses, "bytes": answer_cache.bytes})
+register_stats("llm_gateway", lambda: {"in_flight": _llm._in_flight, "retries": _llm.retries, "hedges": _llm.hedges} if _llm else {})
+register_stats("startup", lambda: {"import_to_ready_seconds": startup_state.import_to_ready} if startup_state.ready_at else {})
+
+# Upper bounds for the function-calling agent loop in main()
+MAX_TOOL_ROUNDS = 5
+MAX_PARALLEL_TOOL_CALLS = 8
+
+SYNTHESIS_INSTRUCTIONS = (
+    "Tools were executed to help answer the user's question. "
+    "Read the tool results and provide a natural, well-formatted response that directly addresses "
+    "the user's original question. Make the information clear, engaging, and easy to understand. "
+    "Format lists with proper bullet points or numbering when appropriate. "
+    "DO NOT DELETE ANY INFORMATION FROM THE TOOL RESULT. "
+    "Reference previous conversation context if relevant to provide better assistance. "
+    "If you still need more data, call further tools."
+)
+
+async def warm_mcp_catalog(name: str, url: str):
+    """Connect to a configured MCP server once so its tool catalog is cached before the first user"""
+    async with sse_client(url=url) as (read_stream, write_stream):
+        async with ClientSession(read_stream, write_stream) as session:
+            await session.initialize()
+            await catalog_cache.prime(SseMcpConnection(name=name, url=url), session)
+
+@cl.on_app_startup
+async def warm_up():
+    """Warm this worker up in the background; /health reports ready once it is done"""
+    if session_store.shared:
+        startup_state.checks["session_store"] = session_store.ping
+    # Spill files are deleted once attached; clear any a crashed worker left behind
+    await asyncio.to_thread(sweep_spill_dir, 3600)
+    if not warmup_config.enabled or startup_state.problems:
+        startup_state.mark_ready()
+        return
+    
+    steps = {
+        "llm_connection": lambda: get_llm().prewarm(idle_after=0),
+        # Loading the tokenizer may download its BPE file; do it before the first message
+        "tokenizer": lambda: asyncio.to_thread(get_encoding)
+    }
+    for name, url in warmup_config.mcp_servers:
+        steps[f"mcp:{name}"] = lambda name=name, url=url: warm_mcp_catalog(name, url)
+    if session_store.shared:
+        steps["session_store"] = session_store.ping
+    startup_state.start_warmup(steps, warmup_config.timeout)
+
 @cl.on_chat_start
 async def start():
-    """Initialize conversation history"""
-    cl.user_session.set("conversation_history", [])
+    """Initialize conversation history (restored from the session store if this session has one)"""
+    await load_session_state()
+    cl.user_session.set("tool_registry", ToolRegistry())
     await cl.Message("👋 Hello! I'm your AI assistant with access to various tools. How can I help you today?").send()
 
 @cl.on_mcp_connect
 async def on_mcp_connect(connection, session: ClientSession):
     """Handle connection to multiple MCP servers"""
     # Store sessions by connection name
-    mcp_sessions = cl.user_session.get("mcp_sessions", {})
-    mcp_sessions[connection.name] = session
-    cl.user_session.set("mcp_sessions", mcp_sessions)
+    registry = get_tool_registry()
+    registry.add_session(connection.name, session, result_scope(connection))
+    track_servers(registry)
     
     await cl.Message(f"✅ Connected to MCP server: **{connection.name}**").send()
 
+    async def on_catalog_refresh(tools: list):
+        # Only apply if this session is still the one connected under that name
+        if registry.sessions.get(connection.name) is session:
+            registry.add_tools(connection.name, tools)
+            logger.info(f"Tool catalog for '{connection.name}' refreshed: {len(tools)} tools")
+
     try:
-        result = await session.list_tools()
-        tools = [
-            {
-                "name": t.name,
-                "description": t.description,
-                "input_schema": t.inputSchema,
-                "server": connection.name
-            }
-            for t in result.tools
-        ]
+        # Served from the shared catalog cache when possible; refreshed in the background
+        tools, cached = await catalog_cache.get_tools(connection, session)
+        # Catalog changes found by any session's refresh are applied here too
+        catalog_cache.watch(connection, session, on_catalog_refresh)
+        logger.debug(f"Loaded {len(tools)} tools for '{connection.name}' ({'cache' if cached else 'list_tools'})")
 
-        # Store tools by server
-        mcp_tools = cl.user_session.get("mcp_tools", {})
-        mcp_tools[connection.name] = tools
-        cl.user_session.set("mcp_tools", mcp_tools)
+        # Index tools by server; duplicate names keep routing to the first server
+        shadowed = registry.add_tools(connection.name, tools)
         
         tools_info = {tool["name"]: f"{tool['description']} (from {connection.name})" for tool in tools}
         await cl.Message(
@@ -50,40 +227,100 @@ async def on_mcp_connect(connection, session: ClientSession):
             "\n".join([f"• **{name}**: {desc}" for name, desc in tools_info.items()])
         ).send()
         
+        if shadowed:
+            await cl.Message(
+                f"⚠️ **{connection.name}** exposes tools already provided by another server; "
+                f"calls keep going to the first server: {', '.join(shadowed)}"
+            ).send()
+        
     except Exception as e:
         await cl.Message(f"❌ Error listing tools from {connection.name}: {str(e)}").send()
 
 @cl.on_mcp_disconnect
 async def on_mcp_disconnect(name: str, session: ClientSession):
     """Handle disconnection from MCP servers"""
-    # Remove session
-    mcp_sessions = cl.user_session.get("mcp_sessions", {})
-    if name in mcp_sessions:
-        del mcp_sessions[name]
-        cl.user_session.set("mcp_sessions", mcp_sessions)
-
-    # Remove tools
-    mcp_tools = cl.user_session.get("mcp_tools", {})
-    if name in mcp_tools:
-        del mcp_tools[name]
-        cl.user_session.set("mcp_tools", mcp_tools)
+    # Remove session and tools
+    catalog_cache.unwatch(session)
+    untrack_servers([name])
+    get_tool_registry().remove_server(name)
 
     await cl.Message(f"❌ Disconnected from MCP server: **{name}**").send()
 
+@cl.on_chat_end
+async def end():
+    """Release worker-wide state that only this session could use"""
+    registry = cl.user_session.get("tool_registry")
+    for session in (registry.sessions.values() if registry is not None else []):
+        catalog_cache.unwatch(session)
+    untrack_servers()
+    if not session_store.shared:
+        # Only a reconnect to this worker could read it, and cl.user_session
+        # still holds the history for that; keeping it would grow memory per session
+        await session_store.delete(session_state_key())
+
+def track_servers(registry: ToolRegistry):
+    """Count this session's connections in `connected_servers` (again after a chat end and resume)"""
+    tracked = cl.user_session.get("tracked_servers")
+    if tracked is None:
+        tracked = {}
+        cl.user_session.set("tracked_servers", tracked)
+    for server_name in registry.sessions:
+        identity = registry.identity(server_name)
+        if tracked.get(server_name) == identity:
+            continue
+        if server_name in tracked:
+            release_server(tracked.pop(server_name))
+        tracked[server_name] = identity
+        connected_servers[identity] += 1
+
+def untrack_servers(server_names: list = None):
+    """Stop counting this session's connections (all of them by default)"""
+    tracked = cl.user_session.get("tracked_servers") or {}
+    for server_name in list(tracked) if server_names is None else server_names:
+        identity = tracked.pop(server_name, None)
+        if identity is not None:
+            release_server(identity)
+
+def release_server(identity: str):
+    """Drop worker-wide state for a server once no session is connected to it"""
+    connected_servers[identity] -= 1
+    if connected_servers[identity] > 0:
+        return
+    del connected_servers[identity]
+    tool_executor.forget(identity)
+    catalog_cache.forget(identity)
+    if is_private_scope(identity):
+        tool_cache.invalidate(identity)
+
+def get_tool_registry() -> ToolRegistry:
+    """Get the current session's tool registry, creating it if needed"""
+    registry = cl.user_session.get("tool_registry")
+    if registry is None:
+        registry = ToolRegistry()
+        cl.user_session.set("tool_registry", registry)
+    return registry
+
 def find_tool_server(tool_name: str) -> tuple[str, ClientSession]:
     """Find which MCP server provides a specific tool"""
-    mcp_tools = cl.user_session.get("mcp_tools", {})
-    mcp_sessions = cl.user_session.get("mcp_sessions", {})
-    
-    for server_name, tools in mcp_tools.items():
-        for tool in tools:
-            if tool["name"] == tool_name:
-                if server_name in mcp_sessions:
-                    return server_name, mcp_sessions[server_name]
-                else:
-                    raise Exception(f"Tool '{tool_name}' found but server '{server_name}' is not connected")
-    
-    raise Exception(f"Tool '{tool_name}' not found in any connected MCP server")
+    return get_tool_registry().resolve(tool_name)
+
+async def invoke_tool(server_name: str, session: ClientSession, tool_name: str, parameters: dict):
+    """Call a tool through the result cache and the executor (timeout, breaker, per-server slots)"""
+    registry = get_tool_registry()
+    ttl = tool_cache.ttl_for(registry.tools_by_name[tool_name])
+
+    async def call_server():
+        # Only calls that reach the server are timed (not cache hits or joined calls)
+        with tool_span(server_name, tool_name):
+            return await session.call_tool(tool_name, parameters)
+
+    return await tool_cache.get_or_call(
+        registry.identity(server_name),
+        tool_name,
+        parameters,
+        ttl,
+        lambda: tool_executor.run(registry.identity(server_name), tool_name, call_server, label=server_name)
+    )
 
 @cl.step(type="tool")
 async def call_tool(tool_use):
@@ -92,294 +329,535 @@ async def call_tool(tool_use):
         # Find which server provides this tool
         server_name, session = find_tool_server(tool_use.name)
         
-        print(f"[DEBUG] Calling tool '{tool_use.name}' on server '{server_name}'")
-        
-        # Execute tool with timeout
-        result = await asyncio.wait_for(
-            session.call_tool(tool_use.name, tool_use.input),
-            timeout=30.0
-        )
-        
-        print(f"[DEBUG] Tool '{tool_use.name}' completed successfully on '{server_name}'")
+        logger.debug(f"Calling tool '{tool_use.name}' on server '{server_name}'")
+        result = await invoke_tool(server_name, session, tool_use.name, tool_use.input)
+        logger.debug(f"Tool '{tool_use.name}' completed successfully on '{server_name}'")
         return result
         
-    except asyncio.TimeoutError:
-        raise Exception(f"Tool '{tool_use.name}' execution timed out after 30 seconds")
     except Exception as e:
         raise Exception(f"Tool execution failed: {str(e)}")
 
-def get_all_available_tools() -> list:
-    """Get all tools from all connected MCP servers"""
-    mcp_tools = cl.user_session.get("mcp_tools", {})
-    all_tools = []
+async def summarize_tool_chunk(tool_name: str, chunk: str, max_tokens: int) -> str:
+    """Map step for oversized tool results: condense one chunk of the payload into `max_tokens`"""
+    response = await get_llm().create(
+        model=azure_config.deployment,
+        messages=[
+            {
+                "role": "system",
+                "content": (
+                    f"You condense one part of a large result returned by the '{tool_name}' tool. "
+                    "Keep every distinct item, name, number, date and link; drop repetition and boilerplate. "
+                    f"Stay under {min(max_tokens, TOOL_RESULT_SUMMARY_MAX_TOKENS)} tokens. "
+                    "Reply with the condensed content only."
+                )
+            },
+            {"role": "user", "content": chunk}
+        ],
+        temperature=0.0,
+        max_tokens=min(max_tokens, TOOL_RESULT_SUMMARY_MAX_TOKENS)
+    )
+    record_usage(response.usage)
+    return response.choices[0].message.content.strip()
+
+def new_tool_outcome(tool_call: dict) -> dict:
+    """Empty outcome record for a native tool call"""
+    return {
+        "tool_call_id": tool_call["id"],
+        "tool_name": tool_call["function"]["name"],
+        "server": None,
+        "parameters": {},
+        "error": None,
+        "cancelled": False,
+        "spill_path": None,
+        "images": []
+    }
+
+async def execute_tool_call(tool_call: dict) -> dict:
+    """Run a single native tool call and return its outcome for the agent loop"""
+    tool_name = tool_call["function"]["name"]
+    outcome = new_tool_outcome(tool_call)
     
-    for server_name, tools in mcp_tools.items():
-        for tool in tools:
-            # Add server context to tool info
-            tool_with_server = tool.copy()
-            tool_with_server["display_name"] = f"{tool['name']} (via {server_name})"
-            all_tools.append(tool_with_server)
+    try:
+        parameters = json.loads(tool_call["function"]["arguments"] or "{}")
+        outcome["parameters"] = parameters
+        outcome["server"], _ = find_tool_server(tool_name)
+        
+        logger.debug(f"Executing tool: {tool_name} with parameters: {parameters}")
+        tool_result = await call_tool(type('ToolUse', (), {"name": tool_name, "input": parameters})())
+        logger.debug(f"Tool result type: {type(tool_result)}")
+        
+        # Extract content by item type, bounded to the prompt token cap
+        with span("result_extraction"):
+            processed = await process_tool_result(
+                tool_result,
+                tool_name,
+                TOOL_RESULT_MAX_TOKENS,
+                summarizer=summarize_tool_chunk,
+                chunk_tokens=TOOL_RESULT_CHUNK_TOKENS
+            )
+        logger.debug(f"Extracted {processed.total_tokens} tokens (spilled to {processed.spill_path})")
+        outcome["content"] = prompt_text(processed)
+        outcome["spill_path"] = processed.spill_path
+        outcome["images"] = processed.images
+        
+    except Exception as e:
+        logger.error(f"Tool execution failed: {str(e)}")
+        outcome["error"] = str(e)
+        outcome["content"] = f"Tool '{tool_name}' failed: {str(e)}. Answer using your general knowledge instead."
     
-    return all_tools
+    return outcome
+
+async def summarize_history(previous_summary: str, transcript: str) -> str:
+    """Fold older conversation turns into the running summary"""
+    response = await get_llm().create(
+        model=azure_config.deployment,
+        messages=[
+            {
+                "role": "system",
+                "content": (
+                    "Update the running summary of a conversation between a user and an AI assistant. "
+                    "Keep facts, names, numbers, user preferences and which tools returned what. "
+                    "Be concise; reply with the updated summary only."
+                )
+            },
+            {"role": "user", "content": f"Current summary:\n{previous_summary or '(empty)'}\n\nNew turns:\n{transcript}"}
+        ],
+        temperature=0.0,
+        max_tokens=HISTORY_SUMMARY_MAX_TOKENS
+    )
+    record_usage(response.usage)
+    return response.choices[0].message.content.strip()
+
+def get_conversation_history() -> ConversationHistory:
+    """Get the current session's conversation history, creating it if needed"""
+    history = cl.user_session.get("conversation_history")
+    if history is None:
+        history = ConversationHistory(HISTORY_TOKEN_BUDGET, summarize_history)
+        cl.user_session.set("conversation_history", history)
+    return history
+
+def session_state_key() -> str:
+    return f"history:{cl.context.session.id}"
+
+async def load_session_state():
+    """Restore this session's history from the session store, e.g. on another worker or after a restart"""
+    if cl.user_session.get("conversation_history") is not None:
+        return
+    history = None
+    try:
+        data = await session_store.get(session_state_key())
+        if data:
+            history = ConversationHistory.from_state(unpack(data), HISTORY_TOKEN_BUDGET, summarize_history)
+    except Exception as e:
+        logger.error(f"Could not load session state: {str(e)}")
+    cl.user_session.set("conversation_history", history or ConversationHistory(HISTORY_TOKEN_BUDGET, summarize_history))
+
+async def save_session_state():
+    """Write this turn's session state to the store in a single batch"""
+    history = cl.user_session.get("conversation_history")
+    if history is None:
+        return
+    try:
+        await session_store.set_many({session_state_key(): pack(history.to_state())}, ttl=SESSION_STATE_TTL)
+    except Exception as e:
+        logger.error(f"Could not save session state: {str(e)}")
 
 def add_to_conversation_history(role: str, content: str, tool_info: dict = None):
     """Add message to conversation history with optional tool information"""
-    conversation_history = cl.user_session.get("conversation_history", [])
-    
-    message_entry = {
-        "role": role,
-        "content": content,
-        "timestamp": asyncio.get_event_loop().time()
-    }
-    
-    if tool_info:
-        message_entry["tool_info"] = tool_info
-    
-    conversation_history.append(message_entry)
-    
-    # Keep only last 20 messages to prevent context window overflow
-    if len(conversation_history) > 20:
-        conversation_history = conversation_history[-20:]
-    
-    cl.user_session.set("conversation_history", conversation_history)
+    get_conversation_history().add(role, content, tool_info)
+
+# Static part of the tool-enabled system prompt. It is kept ahead of the
+# per-catalog tool listing so the longest possible prefix stays byte-identical
+# across turns and sessions, which is what Azure OpenAI prompt caching keys on.
+TOOL_SYSTEM_PROMPT = (
+    "You are a helpful AI assistant with access to multiple MCP tools and conversation memory.\n\n"
+    "**IMPORTANT TOOL USAGE RULES:**\n"
+    "- ALWAYS use a tool when the user asks for specific data, services, information that requires external APIs\n"
+    "- ALWAYS use a tool when the user mentions tool names like 'gcnotify', 'news', etc.\n"
+    "- ALWAYS use a tool when the user asks to 'get', 'fetch', 'retrieve', 'list', 'show' specific data\n"
+    "- Call tools through the function-calling interface using the exact tool name (without server suffix)\n"
+    "- When several independent pieces of data are needed, request all of the tool calls at once\n"
+    "- If you do NOT want to call a tool, reply as a normal helpful assistant\n"
+    "- You remember previous conversations and can reference them naturally\n"
+    "- When in doubt about whether to use a tool, USE THE TOOL - it's better to provide real data\n\n"
+    "**Examples of when to use tools:**\n"
+    "- 'get gcnotify services' -> use gcnotify tool\n"
+    "- 'show me the news' -> use news tool\n"
+    "- 'list services' -> use appropriate service tool\n"
+    "- 'what's happening in canada' -> use news tool\n\n"
+    "**Available tools:**\n"
+)
+
+NO_TOOLS_SYSTEM_PROMPT = (
+    "You are a helpful AI assistant with conversation memory. "
+    "Currently, no MCP tools are available. "
+    "Answer questions using your general knowledge and remember previous conversations."
+)
 
-def build_conversation_messages(current_message: str, all_tools: list) -> list:
-    """Build complete conversation context for LLM"""
-    conversation_history = cl.user_session.get("conversation_history", [])
+def render_system_prompt(registry: ToolRegistry, tools: list) -> str:
+    """Get the system prompt listing `tools`, re-rendering only when the catalog or selection changes"""
+    cache_key = (id(registry), registry.version, tuple(tool["name"] for tool in tools))
+    cached = cl.user_session.get("system_prompt_cache")
+    if cached and cached[0] == cache_key:
+        return cached[1]
     
-    # Build system prompt with tools
-    if all_tools:
+    if tools:
         tools_list = "\n".join([
             f"- **{tool['name']}**: {tool['description']} (via {tool['server']})"
-            for tool in all_tools
+            for tool in tools
         ])
-        system_content = (
-            "You are a helpful AI assistant with access to multiple MCP tools and conversation memory.\n\n"
-            f"**Available tools:**\n{tools_list}\n\n"
-            "**IMPORTANT TOOL USAGE RULES:**\n"
-            "- ALWAYS use a tool when the user asks for specific data, services, information that requires external APIs\n"
-            "- ALWAYS use a tool when the user mentions tool names like 'gcnotify', 'news', etc.\n"
-            "- ALWAYS use a tool when the user asks to 'get', 'fetch', 'retrieve', 'list', 'show' specific data\n"
-            "- If you want to call a tool, reply ONLY with a JSON object using the exact tool name (without server suffix)\n"
-            "- Use double quotes for all keys and string values, and use true/false/null in lowercase\n"
-            "- Example: {\"tool_name\": \"EXACT_TOOL_NAME\", \"parameters\": {\"param\": \"value\"}}\n"
-            "- If you do NOT want to call a tool, reply as a normal helpful assistant, NOT as a JSON object\n"
-            "- You remember previous conversations and can reference them naturally\n"
-            "- When in doubt about whether to use a tool, USE THE TOOL - it's better to provide real data\n\n"
-            "**Examples of when to use tools:**\n"
-            "- 'get gcnotify services' -> use gcnotify tool\n"
-            "- 'show me the news' -> use news tool\n"
-            "- 'list services' -> use appropriate service tool\n"
-            "- 'what's happening in canada' -> use news tool"
-        )
+        system_content = TOOL_SYSTEM_PROMPT + tools_list
     else:
-        system_content = (
-            "You are a helpful AI assistant with conversation memory. "
-            "Currently, no MCP tools are available. "
-            "Answer questions using your general knowledge and remember previous conversations."
-        )
+        system_content = NO_TOOLS_SYSTEM_PROMPT
     
-    # Start with system message
-    messages = [{"role": "system", "content": system_content}]
+    cl.user_session.set("system_prompt_cache", (cache_key, system_content))
+    return system_content
+
+def build_conversation_messages(registry: ToolRegistry, tools: list) -> list:
+    """Build complete conversation context for LLM.
+
+    The current user message must already be in the history; it is always the
+    last entry of the token-budgeted window.
+    """
+    # Start with system message, then the summary and recent turns that fit the budget
+    messages = [{"role": "system", "content": render_system_prompt(registry, tools)}]
+    messages.extend(get_conversation_history().window())
+    return messages
+
+async def run_tool_round(messages: list, llm_reply: str, tool_calls: list, tools_used: list):
+    """Execute one round of tool calls and append the assistant and tool messages"""
+    messages.append({"role": "assistant", "content": llm_reply or None, "tool_calls": tool_calls})
     
-    # Add conversation history (convert to OpenAI format)
-    for entry in conversation_history:
-        # Skip tool info for OpenAI messages, but preserve the content
-        messages.append({
-            "role": entry["role"],
-            "content": entry["content"]
-        })
+    # Show tool execution message with server info
+    routed = []
+    for tool_call in tool_calls:
+        tool_name = tool_call["function"]["name"]
+        try:
+            server_name, _ = find_tool_server(tool_name)
+            routed.append(f"**{tool_name}** via **{server_name}**")
+        except Exception:
+            routed.append(f"**{tool_name}**")
+    round_id = uuid.uuid4().hex
+    cancel_action = cl.Action(name="cancel_tools", payload={"round_id": round_id}, label="Cancel", icon="circle-stop")
+    await cl.Message(content=f"🔄 Calling {', '.join(routed)}...", actions=[cancel_action]).send()
     
-    # Add current user message
-    messages.append({"role": "user", "content": current_message})
+    # Independent tool calls run concurrently, each on its own server session;
+    # they are registered so the Cancel button can stop them individually
+    tasks = [asyncio.ensure_future(execute_tool_call(tool_call)) for tool_call in tool_calls]
+    running_tools = cl.user_session.get("running_tools") or {}
+    running_tools[round_id] = tasks
+    cl.user_session.set("running_tools", running_tools)
+    try:
+        await asyncio.wait(tasks)
+    except asyncio.CancelledError:
+        # The turn was stopped: nothing gets attached, so drop results already spilled
+        for task in tasks:
+            if task.done() and not task.cancelled():
+                discard_spill(task.result()["spill_path"])
+        raise
+    finally:
+        running_tools.pop(round_id, None)
+        # If the whole turn is stopped, do not leave tool calls running behind it
+        for task in tasks:
+            task.cancel()
+    await cancel_action.remove()
     
-    return messages
+    outcomes = []
+    for tool_call, task in zip(tool_calls, tasks):
+        if not task.cancelled():
+            outcomes.append(task.result())
+            continue
+        outcome = new_tool_outcome(tool_call)
+        outcome["cancelled"] = True
+        outcome["error"] = "cancelled by the user"
+        outcome["content"] = f"The user cancelled the '{outcome['tool_name']}' tool call. Answer without its result."
+        outcomes.append(outcome)
+    
+    try:
+        for outcome in outcomes:
+            # Large payloads and images go to the UI as attachments instead of the prompt
+            elements = [
+                cl.Image(name=f"{outcome['tool_name']}-{index + 1}", content=data, mime=mime, display="inline")
+                for index, (mime, data) in enumerate(outcome["images"])
+            ]
+            if outcome["spill_path"]:
+                elements.append(cl.File(name=os.path.basename(outcome["spill_path"]), path=outcome["spill_path"], display="inline"))
+            if elements:
+                await cl.Message(content=f"📎 Full result from **{outcome['tool_name']}**", elements=elements).send()
+        
+            if outcome["cancelled"]:
+                await cl.Message(content=f"⏹️ Cancelled **{outcome['tool_name']}**").send()
+            elif outcome["error"]:
+                await cl.Message(
+                    content=f"❌ Error using **{outcome['tool_name']}**: {outcome['error']}\n\nLet me try to help you in another way."
+                ).send()
+            else:
+                tools_used.append({
+                    "tool_used": outcome["tool_name"],
+                    "server": outcome["server"],
+                    "parameters": outcome["parameters"]
+                })
+            messages.append({"role": "tool", "tool_call_id": outcome["tool_call_id"], "content": outcome["content"]})
+    finally:
+        # Chainlit copies sent files into the session, so spill files are no longer needed
+        for outcome in outcomes:
+            discard_spill(outcome["spill_path"])
+    
+    if not any(m.get("content") == SYNTHESIS_INSTRUCTIONS for m in messages):
+        messages.append({"role": "system", "content": SYNTHESIS_INSTRUCTIONS})
+
+@cl.action_callback("cancel_tools")
+async def cancel_tools(action: cl.Action):
+    """Cancel the tool calls of a round that is still running"""
+    running_tools = cl.user_session.get("running_tools") or {}
+    for task in running_tools.get(action.payload.get("round_id"), []):
+        task.cancel()
+    await action.remove()
+
+def get_intent_router(registry: ToolRegistry) -> IntentRouter:
+    """Get the fast intent router for the current tool catalog, rebuilding it when it changes"""
+    cache_key = (id(registry), registry.version)
+    cached = cl.user_session.get("intent_router")
+    if cached and cached[0] == cache_key:
+        return cached[1]
+    # Only tools safe to replay (the ones the result cache may serve) run without the model
+    router = IntentRouter(
+        registry.tools,
+        min_score=INTENT_ROUTER_MIN_SCORE,
+        replayable=lambda tool: bool(tool_cache.ttl_for(tool))
+    )
+    cl.user_session.set("intent_router", (cache_key, router))
+    return router
+
+def start_tool_prefetches(router: IntentRouter, message_content: str) -> ToolPrefetcher:
+    """Start likely argument-free, cacheable tools while the first completion is generated"""
+    prefetcher = ToolPrefetcher()
+    # Candidates are replay-safe (cacheable) tools: the result lands in the cache the model's call reads
+    for tool in router.candidates(message_content, limit=TOOL_PREFETCH_MAX, min_score=TOOL_PREFETCH_MIN_SCORE):
+        try:
+            server_name, session = find_tool_server(tool["name"])
+        except Exception:
+            continue
+        prefetcher.start(tool["name"], lambda server_name=server_name, session=session, name=tool["name"]: invoke_tool(server_name, session, name, {}))
+    return prefetcher
+
+def record_prewarm(prewarm: tuple):
+    """Credit a finished connection prewarm with the handshake time it took off the next completion"""
+    started, task = prewarm
+    if task.done() and not task.cancelled() and task.result() is not None:
+        record_overlap("connection_prewarm", started, started + task.result(), time.perf_counter())
+
+def get_tool_selector(registry: ToolRegistry) -> ToolSelector:
+    """Get the tool retrieval index for the current catalog (its embeddings are shared across sessions)"""
+    cache_key = (id(registry), registry.version)
+    cached = cl.user_session.get("tool_selector")
+    if cached and cached[0] == cache_key:
+        return cached[1]
+    selector = ToolSelector(registry.tools, top_k=TOOL_SELECTION_TOP_K)
+    cl.user_session.set("tool_selector", (cache_key, selector))
+    return selector
+
+def select_prompt_tools(registry: ToolRegistry, message_content: str, always: list = None) -> list:
+    """The tools to show the model this turn: all of them, or the top-k for large catalogs"""
+    if not TOOL_SELECTION_TOP_K or len(registry.tools) <= TOOL_SELECTION_TOP_K:
+        return registry.tools
+    return get_tool_selector(registry).select(message_content, always)
+
+def catalog_fingerprint(registry: ToolRegistry) -> str:
+    """Digest of the tools on offer (servers by `catalog_cache.result_scope`), equal across sessions that see the same catalog"""
+    cache_key = (id(registry), registry.version)
+    cached = cl.user_session.get("catalog_fingerprint")
+    if cached and cached[0] == cache_key:
+        return cached[1]
+    catalog = "\n".join(
+        f"{registry.identity(tool['server'])}\x00{tool['name']}\x00{tool['description']}" for tool in registry.tools
+    )
+    fingerprint = hashlib.sha256(catalog.encode()).hexdigest()
+    cl.user_session.set("catalog_fingerprint", (cache_key, fingerprint))
+    return fingerprint
+
+def answer_ttl(registry: ToolRegistry, message_content: str, tools_used: list) -> float:
+    """How long a tool-backed answer may be replayed: the shortest TTL of its tools, or None"""
+    if not tools_used or not arguments_in_message(normalize_message(message_content), tools_used):
+        return None
+    ttls = []
+    for used in tools_used:
+        tool = registry.tools_by_name.get(used["tool_used"])
+        ttl = tool_cache.ttl_for(tool) if tool else None
+        if not ttl:
+            return None
+        ttls.append(ttl)
+    return min(ttls)
+
+async def send_cached_answer(message: cl.Message, cached) -> None:
+    """Serve a cached answer straight into the chat, marked as cached"""
+    add_to_conversation_history("user", message.content)
+    add_to_conversation_history("assistant", cached.answer, {"tools": cached.tools_used, "cached": True})
+    age = max(0, int(time.time() - cached.created_at))
+    await cl.Message(content=f"{cached.answer}\n\n*⚡ Cached answer from {age}s ago*").send()
+    TURNS.labels(path="cached").inc()
 
 @cl.on_message
 async def main(message: cl.Message):
-    """Main message handler with improved tool detection"""
-    mcp_sessions = cl.user_session.get("mcp_sessions", {})
-    all_tools = get_all_available_tools()
+    """Main message handler, timed end to end"""
+    try:
+        with span("turn"):
+            await load_session_state()
+            await answer_message(message)
+    finally:
+        # Persisted once per turn, after the reply is on screen (or the turn was stopped)
+        with span("state_save"):
+            await save_session_state()
+
+async def answer_message(message: cl.Message):
+    """Answer one user message with the native function-calling agent loop"""
+    registry = get_tool_registry()
+    track_servers(registry)
+    # Tools of servers whose circuit is open (or probing) are left out of this turn's prompt
+    unhealthy = tool_executor.open_servers()
+    registry.set_unavailable({name for name in registry.tools_by_server if registry.identity(name) in unhealthy})
+    mcp_sessions = registry.sessions
+    all_tools = registry.tools
     
-    # Add user message to conversation history
-    add_to_conversation_history("user", message.content)
+    # Repeated and near-duplicate questions are answered from the answer cache
+    if answer_cache is not None and all_tools:
+        fingerprint = catalog_fingerprint(registry)
+        with span("answer_cache"):
+            cached = answer_cache.get(fingerprint, message.content)
+        if cached is not None:
+            await send_cached_answer(message, cached)
+            return
+    
+    # Obvious argument-free tool intents are dispatched without a first LLM round trip
+    with span("tool_routing"):
+        router = get_intent_router(registry) if all_tools else None
+        routed_tool = router.route(message.content) if router else None
+    
+    # Only the tools relevant to this message go into the prompt for large catalogs
+    with span("tool_selection"):
+        prompt_tools = select_prompt_tools(registry, message.content, [routed_tool["name"]] if routed_tool else None)
+    if prompt_tools is all_tools:
+        tool_schemas = registry.openai_schemas
+    else:
+        tool_schemas = [tool.get("openai_schema") or to_openai_schema(tool) for tool in prompt_tools]
+    
+    # Add user message to conversation history and build the conversation context
+    with span("history_build"):
+        add_to_conversation_history("user", message.content)
+        messages = build_conversation_messages(registry, prompt_tools)
+    # Only answers built from the message alone (no earlier turns or their
+    # summary in the prompt) may be replayed to other sessions
+    shareable_answer = len(messages) == 2
     
     # Show connection status for first message
-    conversation_history = cl.user_session.get("conversation_history", [])
-    if len(conversation_history) <= 1 and not mcp_sessions:
+    conversation_history = get_conversation_history()
+    if conversation_history.message_count <= 1 and not mcp_sessions:
         await cl.Message("⚠️ No MCP servers connected. Some functionality may be limited.").send()
-    elif len(conversation_history) <= 1 and mcp_sessions:
+    elif conversation_history.message_count <= 1 and mcp_sessions:
         connected_servers = list(mcp_sessions.keys())
-        print(f"[DEBUG] Connected to {len(connected_servers)} MCP servers: {connected_servers}")
+        logger.debug(f"Connected to {len(connected_servers)} MCP servers: {connected_servers}")
     
     # Enhanced tool detection - check for keywords that suggest tool usage
     user_message_lower = message.content.lower()
     tool_keywords = ['get', 'fetch', 'retrieve', 'list', 'show', 'find', 'search', 'gcnotify', 'news', 'services']
     contains_tool_keyword = any(keyword in user_message_lower for keyword in tool_keywords)
     
-    # Build conversation context
-    messages = build_conversation_messages(message.content, all_tools)
-    
     # If we detect tool-related keywords and have tools available, be more explicit
-    if contains_tool_keyword and all_tools:
+    if contains_tool_keyword and all_tools and not routed_tool:
         # Add an additional instruction to encourage tool usage
         messages.append({
             "role": "system", 
             "content": "The user's request seems to require external data. You should likely use one of the available tools to provide accurate, up-to-date information rather than guessing."
         })
     
+    tools_used = []
+    tool_rounds = 0  # rounds of tool calls made, whether or not they succeeded
+    first_round = 0
+    # Speculative work overlapped with the turn's critical path
+    prefetcher = ToolPrefetcher()
+    prewarm = None
+    if contains_tool_keyword and router and not routed_tool and TOOL_PREFETCH_MAX:
+        prefetcher = start_tool_prefetches(router, message.content)
+    
     try:
-        # First LLM call to determine if tool usage is needed
-        response = await client.chat.completions.create(
-            model="openai-gpt4o-mini",
-            messages=messages,
-            temperature=0.3,  # Lower temperature for more consistent tool usage
-            max_tokens=1500,
-            stream=False
-        )
-        
-        llm_reply = response.choices[0].message.content.strip()
-        print(f"[DEBUG] LLM response: {llm_reply[:200]}...")
-        
-        # Try to parse as tool call
-        try:
-            tool_call = json.loads(llm_reply)
-            print(f"[DEBUG] Parsed tool call: {tool_call}")
-        except Exception as e:
-            print(f"[DEBUG] Not a tool call, parsing error: {e}")
-            tool_call = None
+        if routed_tool:
+            logger.debug(f"Intent router dispatching '{routed_tool['name']}' (hit rate {router_stats.hit_rate():.0%})")
+            # No completion has run yet this turn: open the LLM connection while the tool runs
+            prewarm = (time.perf_counter(), asyncio.ensure_future(get_llm().prewarm()))
+            tool_call = {
+                "id": f"call_{uuid.uuid4().hex[:24]}",
+                "type": "function",
+                "function": {"name": routed_tool["name"], "arguments": "{}"}
+            }
+            await run_tool_round(messages, "", [tool_call], tools_used)
+            tool_rounds += 1
+            first_round = 1
         
-        # Check if this is a valid tool call
-        if tool_call and tool_call.get("tool_name") and all_tools:
-            tool_name = tool_call["tool_name"]
-            parameters = tool_call.get("parameters", {}) or {}
+        for round_index in range(first_round, MAX_TOOL_ROUNDS + 1):
+            # Once the round budget is spent, force a final answer without tools
+            offer_tools = tool_schemas and round_index < MAX_TOOL_ROUNDS
+            completion_args = {
+                "model": azure_config.deployment,
+                "messages": messages,
+                "temperature": 0.3,  # Lower temperature for more consistent tool usage
+                "max_tokens": 2000 if round_index else 1500
+            }
+            if offer_tools:
+                completion_args["tools"] = tool_schemas
+                completion_args["tool_choice"] = "auto"
             
-            try:
-                # Find which server provides this tool
-                server_name, _ = find_tool_server(tool_name)
-                
-                # Show tool execution message with server info
-                await cl.Message(content=f"🔄 Calling **{tool_name}** via **{server_name}**...").send()
-                
-                print(f"[DEBUG] Executing tool: {tool_name} with parameters: {parameters}")
-                
-                # Execute the tool
-                tool_result = await call_tool(type('ToolUse', (), {"name": tool_name, "input": parameters})())
-                print(f"[DEBUG] Tool result type: {type(tool_result)}")
-                
-                # Extract clean content from tool result
-                if hasattr(tool_result, 'content') and tool_result.content:
-                    if isinstance(tool_result.content, list):
-                        tool_content = "\n".join([
-                            item.text if hasattr(item, 'text') else str(item) 
-                            for item in tool_result.content
-                        ])
-                    else:
-                        tool_content = str(tool_result.content)
-                else:
-                    tool_content = str(tool_result)
-                
-                print(f"[DEBUG] Extracted content length: {len(tool_content)}")
-                
-                # Build synthesis messages with conversation context
-                synthesis_messages = [
-                    {
-                        "role": "system", 
-                        "content": (
-                            "You are a helpful AI assistant with conversation memory. A tool was executed to help answer the user's question. "
-                            "Read the tool result and provide a natural, well-formatted response that directly addresses "
-                            "the user's original question. Make the information clear, engaging, and easy to understand. "
-                            "Format lists with proper bullet points or numbering when appropriate. "
-                            "DO NOT DELETE ANY INFORMATION FROM THE TOOL RESULT. "
-                            "Reference previous conversation context if relevant to provide better assistance."
-                        )
-                    }
-                ]
-                
-                # Add relevant conversation history for context
-                recent_history = cl.user_session.get("conversation_history", [])[-5:]  # Last 5 messages
-                for entry in recent_history[:-1]:  # Exclude current message
-                    synthesis_messages.append({
-                        "role": entry["role"],
-                        "content": entry["content"]
-                    })
-                
-                # Add current context
-                synthesis_messages.extend([
-                    {"role": "user", "content": message.content},
-                    {"role": "assistant", "content": f"I used the {tool_name} tool via {server_name}."},
-                    {"role": "user", "content": f"Tool result: {tool_content}"},
-                    {"role": "user", "content": "Please provide a natural, well-formatted response based on this result and our conversation history."}
-                ])
-                
-                synthesis_response = await client.chat.completions.create(
-                    model="openai-gpt4o-mini",
-                    messages=synthesis_messages,
-                    temperature=0.3,
-                    max_tokens=2000,
-                    stream=False
-                )
-                
-                final_answer = synthesis_response.choices[0].message.content.strip()
-                
-                # Add assistant response to conversation history with tool info
-                add_to_conversation_history("assistant", final_answer, {
-                    "tool_used": tool_name,
-                    "server": server_name,
-                    "parameters": parameters
-                })
-                
-                await cl.Message(content=final_answer).send()
-                
-            except Exception as e:
-                # Handle tool execution errors gracefully
-                print(f"[ERROR] Tool execution failed: {str(e)}")
-                error_message = f"❌ Error using **{tool_name}**: {str(e)}\n\nLet me try to help you in another way."
-                await cl.Message(content=error_message).send()
-                
-                # Fallback response with conversation context
-                fallback_messages = build_conversation_messages(
-                    f"The tool failed, please answer this question using your knowledge: {message.content}", 
-                    []
-                )
-                fallback_messages[0]["content"] = "You are a helpful AI assistant with conversation memory. Answer the user's question using your general knowledge since tools are unavailable."
-                
-                fallback_response = await client.chat.completions.create(
-                    model="openai-gpt4o-mini",
-                    messages=fallback_messages,
-                    temperature=0.7,
-                    max_tokens=1500,
-                    stream=False
-                )
-                
-                fallback_answer = fallback_response.choices[0].message.content.strip()
-                add_to_conversation_history("assistant", fallback_answer)
-                await cl.Message(content=fallback_answer).send()
+            if prewarm is not None:
+                record_prewarm(prewarm)
+                prewarm = None
             
-            return
+            reply_msg = cl.Message(content="")
+            with span("synthesis" if tools_used else "first_llm"):
+                llm_reply, tool_calls, streamed = await stream_completion(get_llm(), reply_msg, **completion_args)
+            logger.debug(f"LLM response: {llm_reply[:200]}... ({len(tool_calls)} tool calls)")
+            
+            if not tool_calls:
+                break
+            
+            # Keep any preamble the model streamed before asking for tools
+            if streamed:
+                await reply_msg.send()
+            
+            prefetcher.claim(tool_calls[:MAX_PARALLEL_TOOL_CALLS])
+            await run_tool_round(messages, llm_reply, tool_calls[:MAX_PARALLEL_TOOL_CALLS], tools_used)
+            tool_rounds += 1
         
-        # If we detected tool keywords but LLM didn't use a tool, suggest it
-        elif contains_tool_keyword and all_tools and not tool_call:
-            print(f"[DEBUG] Tool keywords detected but no tool used. Suggesting tool usage.")
+        # If we detected tool keywords but the LLM never called a tool, suggest it
+        # (not after failed or cancelled calls: those tools were just tried)
+        if contains_tool_keyword and all_tools and not tool_rounds:
+            logger.debug("Tool keywords detected but no tool used. Suggesting tool usage.")
+            if streamed:
+                # The prose reply is already on screen; keep it and follow up
+                add_to_conversation_history("assistant", llm_reply)
+                await reply_msg.send()
             suggestion_msg = f"It looks like you're asking for specific data. I have access to tools that can help. Would you like me to use the available tools to get you that information? Available tools: {', '.join([tool['name'] for tool in all_tools])}"
             add_to_conversation_history("assistant", suggestion_msg)
             await cl.Message(content=suggestion_msg).send()
+            TURNS.labels(path="suggestion").inc()
             return
         
-        elif tool_call and tool_call.get("tool_name") and not all_tools:
-            response_msg = "🔧 I wanted to use a tool to help you, but no MCP servers are currently connected. Let me answer with my general knowledge and our conversation history."
-            add_to_conversation_history("assistant", response_msg)
-            await cl.Message(content=response_msg).send()
+        # Add assistant response to conversation history with tool info
+        add_to_conversation_history("assistant", llm_reply, {"tools": tools_used} if tools_used else None)
+        if not streamed:
+            reply_msg.content = llm_reply
+        await reply_msg.send()
+        TURNS.labels(path="routed" if routed_tool else "tools" if tools_used else "direct").inc()
         
-        # No tool call - show regular LLM response with conversation memory
-        add_to_conversation_history("assistant", llm_reply)
-        await cl.Message(content=llm_reply).send()
+        if answer_cache is not None and all_tools and shareable_answer:
+            answer_cache.put(fingerprint, message.content, llm_reply, tools_used, answer_ttl(registry, message.content, tools_used))
         
     except Exception as e:
-        print(f"[ERROR] Main function error: {str(e)}")
+        logger.error(f"Main function error: {str(e)}")
         error_msg = f"❌ I encountered an error: {str(e)}"
         add_to_conversation_history("assistant", error_msg)
         await cl.Message(content=error_msg).send()
+        TURNS.labels(path="error").inc()
+    finally:
+        prefetcher.finish()
 
 if __name__ == "__main__":
     pass
@@ -0,0 +1,552 @@
+#!/usr/bin/env python3
+
+"""
+Offline load test and benchmark for the Chainlit app.
+
+Runs the on_chat_start -> on_mcp_connect -> on_message flow of app.py for N
+concurrent simulated users against:
+  - a local fake Azure OpenAI server (configurable latency, token rate and
+    429 injection), running in its own thread
+  - in-process stub MCP servers (configurable tool count, payload size and
+    latency)
+  - optionally, a local Redis-protocol stand-in for the session store
+
+Reports p50/p95/p99 turn latency, time-to-first-token, tool-call overhead
+and memory per session. No network access or API keys are needed.
+
+Usage: python benchmark.py --users 50 --turns 5
+
+App settings come from the environment as usual, e.g.
+ANSWER_CACHE_ENABLED=true python benchmark.py
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import shutil
+import socket
+import string
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+from pathlib import Path
+from types import SimpleNamespace
+
+os.environ.setdefault("AZURE_OPENAI_API_KEY", "benchmark")
+
+import uvicorn
+from mcp import types as mcp_types
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+TOPICS = ["news", "services", "weather", "jobs", "events", "alerts", "reports", "contacts"]
+
+CHIT_CHAT = [
+    "hello there",
+    "thanks, that helps",
+    "can you explain that in simpler terms?",
+    "what did I ask you before?"
+]
+
+
+# ---------------------------------------------------------------------------
+# Fake Azure OpenAI server
+# ---------------------------------------------------------------------------
+
+class FakeOpenAI:
+    """OpenAI-compatible chat completions endpoint with tunable performance"""
+
+    def __init__(self, latency: float, tokens_per_second: float, reply_tokens: int, rate_limit_prob: float):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.reply_tokens = reply_tokens
+        self.rate_limit_prob = rate_limit_prob
+        self.requests = 0
+        self.rate_limited = 0
+
+    def app(self) -> Starlette:
+        return Starlette(routes=[
+            Route("/openai/deployments/{deployment}/chat/completions", self.completions, methods=["POST"])
+        ])
+
+    async def completions(self, request: Request):
+        body = await request.json()
+        self.requests += 1
+
+        if random.random() < self.rate_limit_prob:
+            self.rate_limited += 1
+            return JSONResponse(
+                {"error": {"code": "429", "message": "Rate limit is exceeded."}},
+                status_code=429,
+                headers={"retry-after-ms": "200"}
+            )
+
+        await asyncio.sleep(self.latency)
+        prompt_tokens = sum(len(str(m.get("content") or "")) for m in body["messages"]) // 4
+        tool_call = self._pick_tool_call(body)
+        reply = None if tool_call else self._reply_text()
+        completion_tokens = self.reply_tokens if reply else 20
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+        headers = {
+            "x-ratelimit-limit-requests": "10000",
+            "x-ratelimit-remaining-requests": "9999",
+            "x-ratelimit-limit-tokens": "10000000",
+            "x-ratelimit-remaining-tokens": "9999000"
+        }
+
+        if body.get("stream"):
+            return StreamingResponse(
+                self._stream(body["model"], reply, tool_call, usage),
+                media_type="text/event-stream",
+                headers=headers
+            )
+
+        await asyncio.sleep(completion_tokens / self.tokens_per_second)
+        message = {"role": "assistant", "content": reply}
+        if tool_call:
+            message["tool_calls"] = [tool_call]
+        return JSONResponse({
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body["model"],
+            "choices": [{"index": 0, "message": message, "finish_reason": "tool_calls" if tool_call else "stop"}],
+            "usage": usage
+        }, headers=headers)
+
+    def _pick_tool_call(self, body: dict) -> dict:
+        """Ask for a tool on the first round of a turn when the user mentions a topic"""
+        tools = body.get("tools") or []
+        messages = body["messages"]
+        if not tools or messages[-1]["role"] == "tool" or any(m["role"] == "tool" for m in messages[-3:]):
+            return None
+        last_user = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "") or ""
+        for tool in tools:
+            topic = tool["function"]["name"].split("_")[-2]
+            if topic in last_user:
+                required = tool["function"]["parameters"].get("required") or []
+                arguments = {name: "benchmark" for name in required}
+                return {
+                    "id": f"call_{uuid.uuid4().hex[:24]}",
+                    "type": "function",
+                    "function": {"name": tool["function"]["name"], "arguments": json.dumps(arguments)}
+                }
+        return None
+
+    def _reply_text(self) -> str:
+        return " ".join(
+            "".join(random.choices(string.ascii_lowercase, k=random.randint(2, 8)))
+            for _ in range(self.reply_tokens)
+        )
+
+    async def _stream(self, model: str, reply: str, tool_call: dict, usage: dict):
+        def chunk(delta: dict, finish_reason=None, with_usage=False) -> str:
+            payload = {
+                "id": "chatcmpl-benchmark",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [] if with_usage else [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+            }
+            if with_usage:
+                payload["usage"] = usage
+            return f"data: {json.dumps(payload)}\n\n"
+
+        # Azure's prompt-filter chunk comes first and has no choices
+        yield f"data: {json.dumps({'id': '', 'object': '', 'created': 0, 'model': '', 'choices': []})}\n\n"
+        interval = 1.0 / self.tokens_per_second
+
+        if tool_call:
+            yield chunk({"role": "assistant", "tool_calls": [{
+                "index": 0,
+                "id": tool_call["id"],
+                "type": "function",
+                "function": {"name": tool_call["function"]["name"], "arguments": ""}
+            }]})
+            await asyncio.sleep(interval * 5)
+            yield chunk({"tool_calls": [{"index": 0, "function": {"arguments": tool_call["function"]["arguments"]}}]})
+            yield chunk({}, finish_reason="tool_calls")
+        else:
+            yield chunk({"role": "assistant", "content": ""})
+            for word in reply.split(" "):
+                await asyncio.sleep(interval)
+                yield chunk({"content": word + " "})
+            yield chunk({}, finish_reason="stop")
+
+        yield chunk({}, with_usage=True)
+        yield "data: [DONE]\n\n"
+
+
+def start_fake_openai(fake: FakeOpenAI) -> str:
+    """Run the fake server on a free local port in a background thread; returns its base URL"""
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+
+    server = uvicorn.Server(uvicorn.Config(fake.app(), host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    return f"http://127.0.0.1:{port}"
+
+
+# ---------------------------------------------------------------------------
+# Redis-protocol stand-in
+# ---------------------------------------------------------------------------
+
+class FakeRedis:
+    """Minimal RESP2/RESP3 server covering the commands the session store uses (GET/SET/DEL/PING)"""
+
+    def __init__(self):
+        self.data = {}      # key -> (expires_at or None, value)
+        self.commands = 0
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        connection = {"protocol": 2}
+        try:
+            while True:
+                command = await self._read_command(reader)
+                if command is None:
+                    break
+                self.commands += 1
+                writer.write(self._execute(command, connection))
+                await writer.drain()
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _read_command(reader: asyncio.StreamReader) -> list:
+        header = await reader.readline()
+        if not header:
+            return None
+        parts = []
+        for _ in range(int(header[1:])):
+            length = int((await reader.readline())[1:])
+            parts.append((await reader.readexactly(length + 2))[:-2])
+        return parts
+
+    def _execute(self, command: list, connection: dict) -> bytes:
+        name = command[0].upper()
+        if name == b"HELLO":
+            connection["protocol"] = int(command[1]) if len(command) > 1 else 2
+            if connection["protocol"] == 3:
+                return b"%3\r\n+server\r\n+redis\r\n+version\r\n+7.2.0\r\n+proto\r\n:3\r\n"
+            return b"*6\r\n+server\r\n+redis\r\n+version\r\n+7.2.0\r\n+proto\r\n:2\r\n"
+        if name == b"PING":
+            return b"+PONG\r\n"
+        if name == b"GET":
+            entry = self.data.get(command[1])
+            if entry is None or (entry[0] is not None and entry[0] <= time.monotonic()):
+                self.data.pop(command[1], None)
+                return b"_\r\n" if connection["protocol"] == 3 else b"$-1\r\n"
+            return b"$%d\r\n%s\r\n" % (len(entry[1]), entry[1])
+        if name == b"SET":
+            options = [part.upper() for part in command[3:]]
+            expires_at = None
+            if b"PX" in options:
+                expires_at = time.monotonic() + int(command[3 + options.index(b"PX") + 1]) / 1000
+            elif b"EX" in options:
+                expires_at = time.monotonic() + int(command[3 + options.index(b"EX") + 1])
+            self.data[command[1]] = (expires_at, command[2])
+            return b"+OK\r\n"
+        if name == b"DEL":
+            removed = sum(self.data.pop(key, None) is not None for key in command[1:])
+            return b":%d\r\n" % removed
+        # Connection setup (CLIENT SETINFO, SELECT...) is simply acknowledged
+        return b"+OK\r\n"
+
+
+def start_fake_redis(fake: FakeRedis) -> str:
+    """Run the stand-in on a free local port in a background thread; returns its URL"""
+    started = threading.Event()
+    address = {}
+
+    async def serve():
+        server = await asyncio.start_server(fake.handle, "127.0.0.1", 0)
+        address["port"] = server.sockets[0].getsockname()[1]
+        started.set()
+        await server.serve_forever()
+
+    threading.Thread(target=lambda: asyncio.run(serve()), daemon=True).start()
+    started.wait()
+    return f"redis://127.0.0.1:{address['port']}/0"
+
+
+# ---------------------------------------------------------------------------
+# Stub MCP servers
+# ---------------------------------------------------------------------------
+
+class StubMcpSession:
+    """Stands in for an mcp.ClientSession with a synthetic tool catalog"""
+
+    def __init__(self, server_name: str, tool_count: int, payload_bytes: int, latency: float, read_only: bool):
+        self.latency = latency
+        self.payload = ("x" * 79 + "\n") * max(1, payload_bytes // 80)
+        self.service_times = []
+        self.tools = []
+        for index in range(tool_count):
+            topic = TOPICS[index % len(TOPICS)]
+            # Every other tool takes a required argument so both the router and the LLM paths run
+            required = ["query"] if index % 2 else []
+            self.tools.append(mcp_types.Tool(
+                name=f"{server_name}_{index}_{topic}_tool",
+                description=f"Fetch {topic} records from {server_name}",
+                inputSchema={"type": "object", "properties": {"query": {"type": "string"}}, "required": required},
+                annotations=mcp_types.ToolAnnotations(readOnlyHint=read_only)
+            ))
+
+    async def list_tools(self):
+        await asyncio.sleep(self.latency)
+        return mcp_types.ListToolsResult(tools=self.tools)
+
+    async def call_tool(self, name: str, arguments: dict = None):
+        started = time.perf_counter()
+        await asyncio.sleep(self.latency)
+        result = mcp_types.CallToolResult(content=[mcp_types.TextContent(type="text", text=self.payload)])
+        self.service_times.append(time.perf_counter() - started)
+        return result
+
+
+# ---------------------------------------------------------------------------
+# Simulated users
+# ---------------------------------------------------------------------------
+
+def make_recording_emitter():
+    from chainlit.emitter import BaseChainlitEmitter
+
+    class RecordingEmitter(BaseChainlitEmitter):
+        """No-op emitter that timestamps the first streamed answer token of a turn"""
+
+        first_token_at = None
+
+        async def stream_start(self, step_dict):
+            if self.first_token_at is None:
+                self.first_token_at = time.perf_counter()
+
+    return RecordingEmitter
+
+
+async def simulate_user(app, args, sessions: list, results: dict):
+    import chainlit as cl
+    from chainlit.context import init_http_context
+
+    context = init_http_context()
+    context.emitter = make_recording_emitter()(context.session)
+
+    await app.start()
+    for server_index, session in enumerate(sessions):
+        # Every user reaches the same stub servers, so their tool results may be shared
+        connection = SimpleNamespace(name=f"server{server_index}", url=f"http://stub-mcp/server{server_index}/sse")
+        await app.on_mcp_connect(connection, session)
+
+    for _ in range(args.turns):
+        if random.random() < args.tool_ratio:
+            question = f"show me the {random.choice(TOPICS[:min(len(TOPICS), args.tools_per_server)])}"
+        else:
+            question = random.choice(CHIT_CHAT)
+
+        context.emitter.first_token_at = None
+        started = time.perf_counter()
+        await app.main(cl.Message(content=question))
+        finished = time.perf_counter()
+
+        results["turns"].append(finished - started)
+        if context.emitter.first_token_at is not None:
+            results["ttft"].append(context.emitter.first_token_at - started)
+
+
+def percentile(values: list, fraction: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def tool_call_totals(metrics) -> tuple[float, float]:
+    """Sum and count of app-measured MCP server call time from the Prometheus histogram"""
+    total = count = 0.0
+    for family in metrics.TOOL_CALL_SECONDS.collect():
+        for sample in family.samples:
+            if sample.name.endswith("_sum"):
+                total += sample.value
+            elif sample.name.endswith("_count"):
+                count += sample.value
+    return total, count
+
+
+def overlap_totals(metrics) -> dict:
+    """Total seconds saved per kind of overlapped work, plus prefetch outcomes"""
+    totals = {}
+    for family in metrics.OVERLAP_SAVED_SECONDS.collect():
+        for sample in family.samples:
+            if sample.name.endswith("_sum"):
+                totals[sample.labels["kind"]] = sample.value
+    prefetches = {}
+    for family in metrics.TOOL_PREFETCHES.collect():
+        for sample in family.samples:
+            if sample.name.endswith("_total"):
+                prefetches[sample.labels["outcome"]] = int(sample.value)
+    return {"saved_seconds": totals, "prefetches": prefetches}
+
+
+async def run(args, workdir: str) -> dict:
+    random.seed(args.seed)
+    # Per-request HTTP client logging would swamp the report
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    fake = FakeOpenAI(args.llm_latency, args.tokens_per_second, args.reply_tokens, args.rate_limit_prob)
+    base_url = start_fake_openai(fake)
+
+    fake_redis = None
+    if args.session_store == "redis":
+        if args.redis_url:
+            os.environ["SESSION_STORE_URL"] = args.redis_url
+        else:
+            fake_redis = FakeRedis()
+            os.environ["SESSION_STORE_URL"] = start_fake_redis(fake_redis)
+
+    # The app reads its Azure OpenAI settings from the environment at import
+    os.environ["AZURE_OPENAI_ENDPOINT"] = base_url
+    # Every run starts cold: tool catalogs cached by an earlier run would skew
+    # the cold start and keep stale tool annotations (e.g. after --no-tool-cache)
+    os.environ["CATALOG_CACHE_DIR"] = os.path.join(workdir, "catalogs")
+
+    if args.memory:
+        tracemalloc.start()
+
+    import app
+    import chainlit.config
+    import metrics
+    import tool_results
+
+    # Attachments and spill files go to the run's directory, not the repo or /tmp
+    chainlit.config.FILES_DIRECTORY = Path(workdir) / "files"
+    chainlit.config.FILES_DIRECTORY.mkdir()
+    tool_results.SPILL_DIR = os.path.join(workdir, "spill")
+
+    # Run the startup warmup as Chainlit would, and time the cold start
+    await app.warm_up()
+    await app.startup_state.wait_ready()
+    # Stub tools are annotated read-only (and so cached) unless the cache is disabled
+    sessions = [
+        StubMcpSession(f"server{index}", args.tools_per_server, args.payload_bytes, args.tool_latency, not args.no_tool_cache)
+        for index in range(args.servers)
+    ]
+
+    results = {"turns": [], "ttft": []}
+    baseline_memory = tracemalloc.get_traced_memory()[0] if args.memory else 0
+    started = time.perf_counter()
+
+    async def delayed_user(index: int):
+        await asyncio.sleep(index * args.ramp / max(1, args.users))
+        await simulate_user(app, args, sessions, results)
+
+    await asyncio.gather(*(delayed_user(index) for index in range(args.users)))
+    elapsed = time.perf_counter() - started
+
+    memory_per_session = None
+    if args.memory:
+        memory_per_session = (tracemalloc.get_traced_memory()[0] - baseline_memory) / args.users
+        tracemalloc.stop()
+
+    app_tool_time, server_calls = tool_call_totals(metrics)
+    stub_tool_time = sum(sum(session.service_times) for session in sessions)
+    stub_tool_calls = sum(len(session.service_times) for session in sessions)
+
+    return {
+        "users": args.users,
+        "import_to_ready_seconds": app.startup_state.import_to_ready,
+        "turns": len(results["turns"]),
+        "wall_seconds": elapsed,
+        "turns_per_second": len(results["turns"]) / elapsed if elapsed else 0.0,
+        "turn_latency": {f"p{int(q * 100)}": percentile(results["turns"], q) for q in (0.5, 0.95, 0.99)},
+        "time_to_first_token": {f"p{int(q * 100)}": percentile(results["ttft"], q) for q in (0.5, 0.95, 0.99)},
+        # Cache hits and calls joined to an in-flight one never reach a server
+        "tool_calls": int(server_calls) + app.tool_cache.hits + app.tool_cache.coalesced,
+        "tool_calls_served_by_stub": stub_tool_calls,
+        "tool_call_overhead_ms": 1000 * (app_tool_time - stub_tool_time) / server_calls if server_calls else None,
+        "memory_per_session_kb": memory_per_session / 1024 if memory_per_session is not None else None,
+        "llm_requests": fake.requests,
+        "llm_rate_limited": fake.rate_limited,
+        "intent_router_hit_rate": app.router_stats.hit_rate(),
+        "overlap": overlap_totals(metrics),
+        "answer_cache_hits": app.answer_cache.hits + app.answer_cache.similar_hits if app.answer_cache is not None else None,
+        "session_store": args.session_store,
+        "session_store_commands": fake_redis.commands if fake_redis is not None else None
+    }
+
+
+def print_report(report: dict):
+    print("📊 Benchmark results")
+    print(f"   cold start: {report['import_to_ready_seconds'] * 1000:.0f} ms from import to ready")
+    print(f"   users: {report['users']}   turns: {report['turns']}   wall: {report['wall_seconds']:.2f}s   "
+          f"throughput: {report['turns_per_second']:.1f} turns/s")
+    for label, key in (("turn latency", "turn_latency"), ("time to first token", "time_to_first_token")):
+        values = report[key]
+        print(f"   {label:<20} p50 {values['p50'] * 1000:8.1f} ms   p95 {values['p95'] * 1000:8.1f} ms   p99 {values['p99'] * 1000:8.1f} ms")
+    if report["tool_call_overhead_ms"] is not None:
+        print(f"   tool calls: {report['tool_calls']} ({report['tool_calls_served_by_stub']} reached a server)   "
+              f"overhead/server call: {report['tool_call_overhead_ms']:.2f} ms")
+    if report["memory_per_session_kb"] is not None:
+        print(f"   memory per session: {report['memory_per_session_kb']:.1f} KiB")
+    print(f"   LLM requests: {report['llm_requests']} ({report['llm_rate_limited']} rate limited)   "
+          f"intent router hit rate: {report['intent_router_hit_rate']:.0%}")
+    overlap = report["overlap"]
+    saved = ", ".join(f"{kind} {seconds * 1000:.0f} ms" for kind, seconds in sorted(overlap["saved_seconds"].items())) or "none"
+    prefetches = ", ".join(f"{count} {outcome}" for outcome, count in sorted(overlap["prefetches"].items())) or "none"
+    print(f"   overlap saved: {saved}   prefetches: {prefetches}")
+    if report["answer_cache_hits"] is not None:
+        print(f"   answer cache hits: {report['answer_cache_hits']}")
+    store_line = f"   session store: {report['session_store']}"
+    if report["session_store_commands"] is not None:
+        store_line += f" (stand-in served {report['session_store_commands']} commands)"
+    print(store_line)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20, help="concurrent simulated users")
+    parser.add_argument("--turns", type=int, default=5, help="messages sent by each user")
+    parser.add_argument("--ramp", type=float, default=1.0, help="seconds over which users join")
+    parser.add_argument("--tool-ratio", type=float, default=0.6, help="fraction of messages that ask for tool data")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="fake Azure time to first byte (s)")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0, help="fake Azure generation speed")
+    parser.add_argument("--reply-tokens", type=int, default=60, help="tokens per fake text reply")
+    parser.add_argument("--rate-limit-prob", type=float, default=0.0, help="probability of a 429 per request")
+    parser.add_argument("--servers", type=int, default=2, help="stub MCP servers per user")
+    parser.add_argument("--tools-per-server", type=int, default=8, help="tools exposed by each stub server")
+    parser.add_argument("--payload-bytes", type=int, default=4000, help="size of each tool result")
+    parser.add_argument("--tool-latency", type=float, default=0.05, help="stub MCP call latency (s)")
+    parser.add_argument("--no-tool-cache", action="store_true", help="disable the tool result cache (for accurate tool overhead)")
+    parser.add_argument("--session-store", choices=["memory", "redis"], default="memory", help="session state backend")
+    parser.add_argument("--redis-url", help="real Redis-protocol server for --session-store redis (default: local stand-in)")
+    parser.add_argument("--memory", action="store_true", help="trace memory per session (slower)")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    workdir = tempfile.mkdtemp(prefix="chainlit-benchmark-")
+    try:
+        report = asyncio.run(run(args, workdir))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,241 @@
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import time
+import uuid
+
+from mcp import ClientSession, types
+
+from metrics import logger
+from session_store import SessionStore, pack, unpack
+from tool_registry import to_openai_schema
+
+
+def server_identity(connection) -> str:
+    """Stable key for an MCP server: its name plus how it is reached (URL or command line)"""
+    parts = {
+        "name": connection.name,
+        "url": getattr(connection, "url", None),
+        "command": getattr(connection, "command", None),
+        "args": getattr(connection, "args", None)
+    }
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()[:32]
+
+
+def shares_results(connection) -> bool:
+    """Whether every user reaching this server identity gets the same results.
+
+    Not so for connections carrying their own headers (per-user credentials),
+    nor for stdio servers: Chainlit starts one process per session, and the
+    environment variables given in the command are not part of the connection.
+    """
+    return not getattr(connection, "headers", None) and not getattr(connection, "command", None)
+
+
+def result_scope(connection) -> str:
+    """Key for worker-wide tool state: the server identity, unique to this connection when not shared.
+
+    Result caches, breakers and answer fingerprints use this key, never the
+    connection name: names are chosen by each user, so two users' unrelated
+    servers may share one, and the same server may go by several.
+    """
+    identity = server_identity(connection)
+    if shares_results(connection):
+        return identity
+    return f"{identity}-{uuid.uuid4().hex[:12]}"
+
+
+def is_private_scope(scope: str) -> bool:
+    """Whether a `result_scope` key belongs to a single connection (its state can go with it)"""
+    return "-" in scope
+
+
+def build_tool_entries(mcp_tools: list, server_name: str) -> list:
+    """Convert MCP tool definitions into the tool dicts shared by every session.
+
+    The display name and OpenAI schema are precomputed here, once per catalog
+    fetch, so sessions can reference these dicts without copying them. They
+    must be treated as read-only.
+    """
+    tools = []
+    for t in mcp_tools:
+        tool = {
+            "name": t.name,
+            "description": t.description,
+            "input_schema": t.inputSchema,
+            "read_only": bool(getattr(t, "annotations", None) and t.annotations.readOnlyHint),
+            "server": server_name,
+            "display_name": f"{t.name} (via {server_name})"
+        }
+        tool["openai_schema"] = to_openai_schema(tool)
+        tools.append(tool)
+    return tools
+
+
+class CatalogCache:
+    """Process-wide, disk-backed cache of MCP tool catalogs (stale-while-revalidate).
+
+    On connect, a known server's tools are served immediately from memory or
+    disk. Entries older than `fresh_seconds` are still served, but a single
+    background `list_tools()` refresh per server updates them. When the
+    catalog changed, every session subscribed with `watch()` to that server
+    is notified. Tool-list-changed notifications force a refresh regardless
+    of age.
+
+    Catalogs are persisted to `directory`, which workers on the same host
+    share, or to `store` when given one shared by every worker and instance.
+    """
+
+    def __init__(self, directory: str, fresh_seconds: float = 300.0, store: SessionStore = None):
+        self.directory = directory
+        self.fresh_seconds = fresh_seconds
+        self.store = store
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self._entries = {}      # identity -> {"fetched_at", "digest", "tools"}
+        self._refreshing = {}   # identity -> asyncio.Task
+        self._subscribers = {}  # identity -> {ClientSession: async callable taking the new tools}
+
+    async def get_tools(self, connection, session: ClientSession) -> tuple[list, bool]:
+        """Get a server's tools; returns (tools, served_from_cache)"""
+        identity = server_identity(connection)
+        entry = self._entries.get(identity)
+        if entry is None:
+            entry = await self._read(identity)
+            if entry is not None:
+                self._entries[identity] = entry
+
+        if entry is None:
+            self.misses += 1
+            tools = await self._fetch(identity, connection, session)
+            return tools, False
+
+        self.hits += 1
+        if time.time() - entry["fetched_at"] > self.fresh_seconds:
+            self.refresh(connection, session)
+        return entry["tools"], True
+
+    async def prime(self, connection, session: ClientSession) -> list:
+        """List a server's tools now and cache them, e.g. at startup before any user connects"""
+        return await self._fetch(server_identity(connection), connection, session)
+
+    def forget(self, identity: str):
+        """Drop a server's in-memory catalog (the persisted copy stays for its next connect)"""
+        self._entries.pop(identity, None)
+        task = self._refreshing.get(identity)
+        if task is not None and task.done():
+            del self._refreshing[identity]
+
+    def refresh(self, connection, session: ClientSession):
+        """Re-list a server's tools in the background (one refresh per server at a time)"""
+        identity = server_identity(connection)
+        task = self._refreshing.get(identity)
+        if task is not None and not task.done():
+            return
+        self._refreshing[identity] = asyncio.ensure_future(self._revalidate(identity, connection, session))
+
+    def watch(self, connection, session: ClientSession, on_refresh):
+        """Subscribe a session to catalog changes of its server, and refresh on tool-list-changed.
+
+        `on_refresh` (async callable taking the new tool list) is called
+        whenever a refresh started by any session finds that the catalog
+        changed, until `unwatch(session)`.
+        """
+        self._subscribers.setdefault(server_identity(connection), {})[session] = on_refresh
+
+        previous_handler = getattr(session, "_message_handler", None)
+        if previous_handler is None:
+            return
+
+        async def handler(message):
+            if isinstance(message, types.ServerNotification) and isinstance(message.root, types.ToolListChangedNotification):
+                logger.info(f"Tool list changed on '{connection.name}', refreshing catalog")
+                self.refresh(connection, session)
+            await previous_handler(message)
+
+        # ClientSession only exposes notifications through its message handler,
+        # which Chainlit does not let us pass in when it creates the session
+        session._message_handler = handler
+
+    def unwatch(self, session: ClientSession):
+        """Stop notifying a session, e.g. once it disconnected"""
+        for identity, subscribers in list(self._subscribers.items()):
+            subscribers.pop(session, None)
+            if not subscribers:
+                del self._subscribers[identity]
+
+    async def _revalidate(self, identity: str, connection, session: ClientSession):
+        previous = self._entries.get(identity)
+        try:
+            tools = await self._fetch(identity, connection, session)
+        except Exception as e:
+            logger.error(f"Background tool catalog refresh failed for '{connection.name}': {str(e)}")
+            return
+        self.refreshes += 1
+        if previous is not None and previous["digest"] == self._entries[identity]["digest"]:
+            return
+        for on_refresh in list(self._subscribers.get(identity, {}).values()):
+            try:
+                await on_refresh(tools)
+            except Exception as e:
+                logger.error(f"Applying the refreshed tool catalog of '{connection.name}' failed: {str(e)}")
+
+    async def _fetch(self, identity: str, connection, session: ClientSession) -> list:
+        result = await session.list_tools()
+        tools = build_tool_entries(result.tools, connection.name)
+        entry = {
+            "fetched_at": time.time(),
+            "digest": hashlib.sha256(json.dumps(tools, sort_keys=True, default=str).encode()).hexdigest(),
+            "tools": tools
+        }
+        previous = self._entries.get(identity)
+        if previous is not None and previous["digest"] == entry["digest"]:
+            # Unchanged: keep sharing the existing dicts, just mark them fresh
+            previous["fetched_at"] = entry["fetched_at"]
+            entry = previous
+        self._entries[identity] = entry
+        await self._write(identity, entry)
+        return entry["tools"]
+
+    async def _read(self, identity: str) -> dict:
+        if self.store is None:
+            return await asyncio.to_thread(self._load, identity)
+        try:
+            data = await self.store.get(f"catalog:{identity}")
+            return unpack(data) if data else None
+        except Exception as e:
+            logger.error(f"Could not read tool catalog from the session store: {str(e)}")
+            return None
+
+    async def _write(self, identity: str, entry: dict):
+        if self.store is None:
+            await asyncio.to_thread(self._store, identity, entry)
+            return
+        try:
+            await self.store.set(f"catalog:{identity}", pack(entry))
+        except Exception as e:
+            logger.error(f"Could not persist tool catalog: {str(e)}")
+
+    def _path(self, identity: str) -> str:
+        return os.path.join(self.directory, f"{identity}.json")
+
+    def _load(self, identity: str) -> dict:
+        try:
+            with open(self._path(identity), encoding="utf-8") as cache_file:
+                return json.load(cache_file)
+        except (OSError, ValueError):
+            return None
+
+    def _store(self, identity: str, entry: dict):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # Write then rename so concurrent workers never read a partial file
+            fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as cache_file:
+                json.dump(entry, cache_file, default=str)
+            os.replace(temp_path, self._path(identity))
+        except OSError as e:
+            logger.error(f"Could not persist tool catalog: {str(e)}")
@@ -0,0 +1,88 @@
+import os
+from dataclasses import dataclass, field
+
+DEFAULT_AZURE_OPENAI_ENDPOINT = "https://platform-core-hackathon-ndtibpy.openai.azure.com"
+DEFAULT_AZURE_OPENAI_DEPLOYMENT = "openai-gpt4o-mini"
+DEFAULT_AZURE_OPENAI_API_VERSION = "2025-01-01-preview"
+
+
+def env_str(name: str, default: str = "") -> str:
+    """Read a string setting; empty values (e.g. unset `${VAR}` in docker-compose) use the default"""
+    return os.getenv(name) or default
+
+
+def env_int(name: str, default: int) -> int:
+    return int(env_str(name, str(default)))
+
+
+def env_float(name: str, default: float) -> float:
+    return float(env_str(name, str(default)))
+
+
+def env_bool(name: str, default: bool) -> bool:
+    return env_str(name, "true" if default else "false").lower() == "true"
+
+
+def parse_mcp_servers(spec: str) -> tuple:
+    """Parse a `name=url,name=url` spec into (name, url) pairs"""
+    servers = []
+    for item in (spec or "").split(","):
+        name, _, url = item.strip().partition("=")
+        if name and url:
+            servers.append((name.strip(), url.strip()))
+    return tuple(servers)
+
+
+@dataclass(frozen=True)
+class AzureOpenAIConfig:
+    """Azure OpenAI connection settings plus the sizing of the LLM gateway in front of it"""
+
+    endpoint: str
+    deployment: str
+    api_version: str
+    api_key: str = field(repr=False)
+    max_connections: int = 100
+    max_keepalive: int = 20
+    max_in_flight: int = 32
+    max_retries: int = 4
+    hedge: bool = True
+
+    @classmethod
+    def from_env(cls) -> "AzureOpenAIConfig":
+        return cls(
+            endpoint=env_str("AZURE_OPENAI_ENDPOINT", DEFAULT_AZURE_OPENAI_ENDPOINT),
+            deployment=env_str("AZURE_OPENAI_DEPLOYMENT", DEFAULT_AZURE_OPENAI_DEPLOYMENT),
+            api_version=env_str("AZURE_OPENAI_API_VERSION", DEFAULT_AZURE_OPENAI_API_VERSION),
+            api_key=env_str("AZURE_OPENAI_API_KEY"),
+            max_connections=env_int("LLM_MAX_CONNECTIONS", 100),
+            max_keepalive=env_int("LLM_MAX_KEEPALIVE", 20),
+            max_in_flight=env_int("LLM_MAX_IN_FLIGHT", 32),
+            max_retries=env_int("LLM_MAX_RETRIES", 4),
+            hedge=env_bool("LLM_HEDGE_REQUESTS", True)
+        )
+
+    def problems(self) -> list:
+        """Settings that keep the app from serving requests (empty when usable)"""
+        problems = []
+        if not self.api_key or self.api_key.startswith("your_"):
+            problems.append("AZURE_OPENAI_API_KEY is not set (or is still a placeholder)")
+        if not self.endpoint.startswith(("https://", "http://")):
+            problems.append(f"AZURE_OPENAI_ENDPOINT is not a URL: {self.endpoint}")
+        return problems
+
+
+@dataclass(frozen=True)
+class WarmupConfig:
+    """What a worker prepares at startup before reporting ready"""
+
+    enabled: bool = True
+    mcp_servers: tuple = ()   # (name, SSE url) pairs whose tool catalogs are cached ahead of users
+    timeout: float = 20.0     # per warmup step
+
+    @classmethod
+    def from_env(cls) -> "WarmupConfig":
+        return cls(
+            enabled=env_bool("WARMUP_ENABLED", True),
+            mcp_servers=parse_mcp_servers(env_str("MCP_WARMUP_SERVERS")),
+            timeout=env_float("WARMUP_TIMEOUT", 20.0)
+        )
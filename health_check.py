@@ -6,7 +6,6 @@ Tests basic imports and configuration
 """
 
 import sys
-import os
 
 def test_imports():
     """Test that all required packages can be imported"""
@@ -27,13 +26,6 @@ def test_imports():
 
 def test_env_config():
     """Test environment configuration"""
-    required_vars = [
-        'AZURE_OPENAI_API_KEY',
-        'AZURE_OPENAI_ENDPOINT', 
-        'AZURE_OPENAI_DEPLOYMENT',
-        'AZURE_OPENAI_API_VERSION'
-    ]
-    
     # Load environment variables
     try:
         from dotenv import load_dotenv
@@ -42,17 +34,17 @@ def test_env_config():
     except Exception as e:
         print(f"⚠️  Could not load .env file: {e}")
     
-    missing_vars = []
-    for var in required_vars:
-        if not os.getenv(var) or os.getenv(var) == f"your_actual_{var.lower()}_here":
-            missing_vars.append(var)
+    # Same settings and checks the app uses (endpoint, deployment and API version have defaults)
+    from config import AzureOpenAIConfig
+    azure_config = AzureOpenAIConfig.from_env()
+    problems = azure_config.problems()
     
-    if missing_vars:
-        print(f"⚠️  Missing or placeholder environment variables: {', '.join(missing_vars)}")
+    if problems:
+        print(f"⚠️  Configuration problems: {'; '.join(problems)}")
         print("   Please update your .env file with actual values")
         return False
     else:
-        print("✅ All required environment variables are set")
+        print(f"✅ Azure OpenAI configured: deployment '{azure_config.deployment}' at {azure_config.endpoint}")
         return True
 
 def main():
@@ -0,0 +1,170 @@
+import asyncio
+import time
+
+from metrics import logger
+
+_encoding = None
+_encoding_loaded = False
+
+# Overhead OpenAI adds per chat message for role and separators
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def get_encoding():
+    """tiktoken's o200k_base encoding, loaded on first use rather than at import.
+
+    tiktoken downloads its BPE file unless TIKTOKEN_CACHE_DIR already holds
+    it, so the load is kept off the import path (startup warmup runs it).
+    """
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception:  # tiktoken missing or its BPE files cannot be fetched
+            _encoding = None
+        _encoding_loaded = True
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    """Count tokens with tiktoken when available, else a ~4 chars/token estimate"""
+    if not text:
+        return 0
+    encoding = get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return len(text) // 4 + 1
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut `text` down to roughly `max_tokens` tokens, marking the cut"""
+    if count_tokens(text) <= max_tokens:
+        return text
+    encoding = get_encoding()
+    if encoding is not None:
+        return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens]) + " …[truncated]"
+    return text[:max_tokens * 4] + " …[truncated]"
+
+
+class ConversationHistory:
+    """Token-budgeted conversation memory with a rolling summary.
+
+    Messages are kept verbatim until they exceed `budget_tokens`. The oldest
+    turns are then folded into a running summary by `summarizer` (an async
+    callable taking the previous summary and the folded transcript) in a
+    background task, so the hot path never waits on the summarization call.
+    Until the summary lands the folded turns are still offered to `window()`,
+    which trims the oldest ones first if they do not fit.
+    """
+
+    def __init__(self, budget_tokens: int, summarizer=None, fold_ratio: float = 0.5):
+        self.budget_tokens = budget_tokens
+        self.summarizer = summarizer
+        self.fold_ratio = fold_ratio
+        self.summary = ""
+        self.entries = []
+        self.message_count = 0  # every message ever added, including folded ones
+        self._folding = []
+        self._task = None
+
+    @property
+    def total_tokens(self) -> int:
+        return sum(entry["tokens"] for entry in self.entries)
+
+    def add(self, role: str, content: str, tool_info: dict = None):
+        """Add message to conversation history with optional tool information"""
+        entry = {
+            "role": role,
+            "content": content,
+            "tokens": count_tokens(content) + MESSAGE_OVERHEAD_TOKENS,
+            "timestamp": time.time()
+        }
+        if tool_info:
+            entry["tool_info"] = tool_info
+        self.entries.append(entry)
+        self.message_count += 1
+
+        if self.total_tokens > self.budget_tokens:
+            self._fold()
+
+    def to_state(self) -> dict:
+        """Plain-data snapshot for the session store (turns still being folded stay verbatim)"""
+        return {
+            "summary": self.summary,
+            "entries": self._folding + self.entries,
+            "message_count": self.message_count
+        }
+
+    @classmethod
+    def from_state(cls, state: dict, budget_tokens: int, summarizer=None) -> "ConversationHistory":
+        """Rebuild a history saved with `to_state`, possibly by another worker"""
+        history = cls(budget_tokens, summarizer)
+        history.summary = state.get("summary", "")
+        history.entries = list(state.get("entries", []))
+        history.message_count = state.get("message_count", len(history.entries))
+        return history
+
+    def window(self, budget_tokens: int = None) -> list:
+        """Get OpenAI-format messages for the most recent history that fits the budget"""
+        budget = self.budget_tokens if budget_tokens is None else budget_tokens
+        messages = []
+
+        if self.summary:
+            summary = f"Summary of the earlier conversation:\n{self.summary}"
+            budget -= count_tokens(summary) + MESSAGE_OVERHEAD_TOKENS
+
+        for entry in reversed(self._folding + self.entries):
+            if entry["tokens"] <= budget:
+                messages.append({"role": entry["role"], "content": entry["content"]})
+                budget -= entry["tokens"]
+            elif not messages and budget > MESSAGE_OVERHEAD_TOKENS:
+                # A single oversized latest message still gets a truncated slot
+                content = truncate_to_tokens(entry["content"], budget - MESSAGE_OVERHEAD_TOKENS)
+                messages.append({"role": entry["role"], "content": content})
+                break
+            else:
+                break
+
+        messages.reverse()
+        if self.summary:
+            messages.insert(0, {"role": "system", "content": summary})
+        return messages
+
+    def _fold(self):
+        """Move the oldest turns out of the verbatim window and summarize them"""
+        if self._task is not None and not self._task.done():
+            return
+
+        target = int(self.budget_tokens * self.fold_ratio)
+        folded = []
+        # Always keep the latest message verbatim
+        while len(self.entries) > 1 and self.total_tokens > target:
+            folded.append(self.entries.pop(0))
+        if not folded:
+            return
+
+        if self.summarizer is None:
+            return
+
+        self._folding = folded
+        try:
+            self._task = asyncio.get_running_loop().create_task(self._summarize(folded))
+        except RuntimeError:
+            # No running loop (e.g. offline use): summarization is skipped, the turns stay
+            self.entries[:0] = folded
+            self._folding = []
+
+    async def _summarize(self, folded: list):
+        transcript = "\n".join(f"{entry['role']}: {entry['content']}" for entry in folded)
+        summarized = False
+        try:
+            self.summary = await self.summarizer(self.summary, transcript)
+            summarized = True
+        except Exception as e:
+            logger.error(f"History summarization failed, retrying on the next message: {str(e)}")
+        finally:
+            if not summarized:
+                # Put the turns back so the next fold picks them up instead of losing them
+                self.entries[:0] = folded
+            self._folding = []
@@ -0,0 +1,145 @@
+import math
+import re
+from collections import Counter
+
+STOPWORDS = {
+    "a", "an", "and", "are", "about", "can", "do", "for", "from", "give", "i", "in", "is", "it",
+    "me", "my", "of", "on", "please", "some", "the", "this", "to", "us", "what", "whats", "with",
+    "you", "your"
+}
+
+# Name tokens say more about intent than free-form description text
+NAME_WEIGHT = 3
+
+
+class RouterStats:
+    """Worker-wide counters for how often the fast router skips the first LLM call"""
+
+    def __init__(self):
+        self.considered = 0
+        self.routed = 0
+
+    def hit_rate(self) -> float:
+        return self.routed / self.considered if self.considered else 0.0
+
+
+router_stats = RouterStats()
+
+
+def tokenize(text: str) -> list:
+    """Split text (including snake_case and camelCase identifiers) into normalized terms"""
+    text = re.sub(r"([a-z])([A-Z])", r"\1 \2", text or "").lower()
+    terms = []
+    for term in re.findall(r"[a-z0-9]+", text):
+        if term in STOPWORDS:
+            continue
+        # Crude plural folding so "services" matches "service"
+        if len(term) > 3 and term.endswith("s") and not term.endswith("ss"):
+            term = term[:-1]
+        terms.append(term)
+    return terms
+
+
+def requires_arguments(tool: dict) -> bool:
+    """Whether a tool's input schema has any required parameters"""
+    schema = tool.get("input_schema") or {}
+    return bool(schema.get("required"))
+
+
+class IntentRouter:
+    """In-process TF-IDF index over tool names and descriptions.
+
+    Used to dispatch obvious tool intents without asking the model first. A
+    route is only returned when the best tool clears `min_score`, beats the
+    runner-up by `min_margin`, shares a term with the user message in its
+    name, takes no required arguments and is safe to replay. `replayable`
+    decides the latter (by default, tools the server annotates read-only):
+    a tool runs here without any model decision, so side-effecting tools
+    must never qualify.
+    """
+
+    def __init__(self, tools: list, min_score: float = 0.3, min_margin: float = 1.5, replayable=None):
+        self.replayable = replayable or (lambda tool: bool(tool.get("read_only")))
+        self.min_score = min_score
+        self.min_margin = min_margin
+        self.tools = tools
+        self._name_terms = []
+        self._vectors = []
+
+        documents = []
+        for tool in tools:
+            name_terms = tokenize(tool["name"])
+            self._name_terms.append(set(name_terms))
+            documents.append(Counter(name_terms * NAME_WEIGHT + tokenize(tool.get("description") or "")))
+
+        document_frequency = Counter()
+        for document in documents:
+            document_frequency.update(document.keys())
+        total = len(documents)
+        self._idf = {
+            term: math.log((total + 1) / (frequency + 1)) + 1.0
+            for term, frequency in document_frequency.items()
+        }
+        self._vectors = [self._weigh(document) for document in documents]
+
+    def score(self, message: str) -> list:
+        """Score every tool against a message; returns (score, index) pairs, best first"""
+        query_terms = Counter(term for term in tokenize(message) if term in self._idf)
+        query = self._weigh(query_terms)
+        if not query:
+            return []
+        scores = [
+            (sum(weight * vector.get(term, 0.0) for term, weight in query.items()), index)
+            for index, vector in enumerate(self._vectors)
+        ]
+        scores.sort(reverse=True)
+        return scores
+
+    def route(self, message: str) -> dict:
+        """Return the tool to dispatch directly for `message`, or None to let the LLM decide"""
+        router_stats.considered += 1
+        tool = self._route(message)
+        if tool is not None:
+            router_stats.routed += 1
+        return tool
+
+    def candidates(self, message: str, limit: int = 2, min_score: float = 0.1) -> list:
+        """Dispatchable tools scoring at least `min_score`, best first (for prefetching)"""
+        tools = []
+        for score, index in self.score(message):
+            if score < min_score or len(tools) >= limit:
+                break
+            tool = self.tools[index]
+            if self.dispatchable(tool):
+                tools.append(tool)
+        return tools
+
+    def dispatchable(self, tool: dict) -> bool:
+        """Whether a tool may run without the model: no required arguments and safe to replay"""
+        return not requires_arguments(tool) and self.replayable(tool)
+
+    def _route(self, message: str) -> dict:
+        scores = self.score(message)
+        if not scores:
+            return None
+
+        best_score, best_index = scores[0]
+        runner_up = scores[1][0] if len(scores) > 1 else 0.0
+        tool = self.tools[best_index]
+
+        if best_score < self.min_score:
+            return None
+        if runner_up and best_score < runner_up * self.min_margin:
+            return None
+        if not self._name_terms[best_index] & set(tokenize(message)):
+            return None
+        if not self.dispatchable(tool):
+            return None
+        return tool
+
+    def _weigh(self, counts: Counter) -> dict:
+        vector = {term: count * self._idf[term] for term, count in counts.items()}
+        norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+        if not norm:
+            return {}
+        return {term: weight / norm for term, weight in vector.items()}
@@ -0,0 +1,289 @@
+import asyncio
+import random
+import time
+from collections import deque
+
+import httpx
+import openai
+
+from history import count_tokens
+from metrics import logger
+
+try:
+    import h2  # noqa: F401  (HTTP/2 support for httpx)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+def build_http_client(max_connections: int = 100, max_keepalive: int = 20, keepalive_expiry: float = 60.0) -> httpx.AsyncClient:
+    """Create the pooled HTTP client shared by every Azure OpenAI request in this worker"""
+    return httpx.AsyncClient(
+        http2=HTTP2_AVAILABLE,
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry
+        ),
+        timeout=httpx.Timeout(60.0, connect=5.0)
+    )
+
+
+class TokenBucket:
+    """Continuously refilling bucket; starts unlimited until a capacity is learned"""
+
+    def __init__(self, refill_window: float = 60.0):
+        self.refill_window = refill_window
+        self.capacity = None
+        self.level = 0.0
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.capacity is not None:
+            rate = self.capacity / self.refill_window
+            self.level = min(self.capacity, self.level + (now - self._updated) * rate)
+        self._updated = now
+
+    def delay_for(self, cost: float) -> float:
+        """Seconds to wait before `cost` units are available (0 if available now)"""
+        if self.capacity is None:
+            return 0.0
+        self._refill()
+        cost = min(cost, self.capacity)
+        if self.level >= cost:
+            return 0.0
+        return (cost - self.level) * self.refill_window / self.capacity
+
+    def take(self, cost: float):
+        if self.capacity is not None:
+            self._refill()
+            self.level -= min(cost, self.capacity)
+
+    def observe(self, limit: str, remaining: str):
+        """Resynchronize with the server's view from x-ratelimit-* headers"""
+        try:
+            limit_value = float(limit) if limit is not None else self.capacity
+            remaining_value = float(remaining)
+        except (TypeError, ValueError):
+            return
+        if not limit_value:
+            return
+        self._refill()
+        self.capacity = limit_value
+        self.level = remaining_value
+
+
+class LLMGateway:
+    """Shared entry point for chat completions in this worker.
+
+    Every completion goes through four stages: a global semaphore bounding
+    in-flight requests (held until a stream is fully consumed), request and
+    token buckets paced from the `x-ratelimit-*` response headers, jittered
+    exponential retry on 429/5xx/connection errors (honouring Retry-After),
+    and request hedging where a duplicate request is raced against one that
+    is slower than the recent p95 to reach response headers. Only
+    non-streamed calls are hedged (a duplicate stream would generate the
+    whole answer twice), and only when the buckets can pay for the backup
+    right away.
+    """
+
+    def __init__(
+        self,
+        client: openai.AsyncAzureOpenAI,
+        max_in_flight: int = 32,
+        max_retries: int = 4,
+        backoff_base: float = 0.5,
+        backoff_cap: float = 20.0,
+        hedge: bool = True,
+        hedge_min_delay: float = 2.0
+    ):
+        self.client = client
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.hedge = hedge
+        self.hedge_min_delay = hedge_min_delay
+        self.max_in_flight = max_in_flight
+        self.requests = TokenBucket()
+        self.tokens = TokenBucket()
+        self.retries = 0
+        self.hedges = 0
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._last_used = 0.0
+        self._pacing_lock = asyncio.Lock()
+        self._latencies = deque(maxlen=200)
+
+    async def create(self, **kwargs):
+        """Drop-in for `client.chat.completions.create`, returning a completion or an async stream"""
+        await self._semaphore.acquire()
+        self._in_flight += 1
+        released = False
+        try:
+            await self._pace(self._estimate_tokens(kwargs))
+            result = await self._create_with_retries(kwargs)
+            if kwargs.get("stream"):
+                released = True
+                return self._guard_stream(result)
+            return result
+        finally:
+            if not released:
+                self._release()
+
+    async def prewarm(self, idle_after: float = 10.0) -> float:
+        """Open a pooled connection ahead of a completion if none was used recently.
+
+        Sends a cheap authenticated GET (its status does not matter) so the
+        TCP/TLS handshake is paid off the critical path. Returns the seconds
+        spent, or None when the pool was recently used and likely still warm.
+        """
+        if time.monotonic() - self._last_used < idle_after:
+            return None
+        self._last_used = time.monotonic()
+        started = time.perf_counter()
+        try:
+            await self.client.get("models", cast_to=httpx.Response, options={"timeout": 5.0})
+        except (openai.APIError, httpx.HTTPError):
+            pass
+        return time.perf_counter() - started
+
+    def _release(self):
+        self._in_flight -= 1
+        self._semaphore.release()
+
+    async def _guard_stream(self, stream):
+        """Hold the in-flight slot until the caller has drained (or abandoned) the stream"""
+        try:
+            async for chunk in stream:
+                yield chunk
+        finally:
+            await stream.close()
+            self._release()
+
+    def _take_now(self, token_cost: int) -> bool:
+        """Take a request's cost from the buckets only if that needs no wait (for hedges)"""
+        if self._pacing_lock.locked() or self._paused_until > time.monotonic():
+            return False
+        if self.requests.delay_for(1) > 0 or self.tokens.delay_for(token_cost) > 0:
+            return False
+        self.requests.take(1)
+        self.tokens.take(token_cost)
+        return True
+
+    async def _pace(self, token_cost: int):
+        async with self._pacing_lock:
+            while True:
+                delay = max(
+                    self._paused_until - time.monotonic(),
+                    self.requests.delay_for(1),
+                    self.tokens.delay_for(token_cost)
+                )
+                if delay <= 0:
+                    break
+                await asyncio.sleep(delay)
+            self.requests.take(1)
+            self.tokens.take(token_cost)
+
+    def _estimate_tokens(self, kwargs: dict) -> int:
+        prompt = sum(count_tokens(str(message.get("content") or "")) for message in kwargs.get("messages", []))
+        return prompt + int(kwargs.get("max_tokens") or 0)
+
+    async def _create_with_retries(self, kwargs: dict):
+        attempt = 0
+        while True:
+            try:
+                return await self._create_hedged(kwargs)
+            except (openai.APIConnectionError, openai.APIStatusError) as e:
+                status = getattr(e, "status_code", None)
+                if attempt >= self.max_retries or (status is not None and status not in RETRYABLE_STATUS):
+                    raise
+                retry_after = self._retry_after(e)
+                if status == 429 and retry_after:
+                    # Every request in the worker waits out a server-mandated pause
+                    self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+                delay = retry_after or random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+                attempt += 1
+                self.retries += 1
+                logger.debug(f"LLM request failed ({status or type(e).__name__}); retry {attempt} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+    async def _create_hedged(self, kwargs: dict):
+        delay = None if kwargs.get("stream") else self._hedge_delay()
+        primary = asyncio.ensure_future(self._create_once(kwargs))
+        if delay is None:
+            return await primary
+
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done:
+            return primary.result()
+
+        # Primary is slower than usual: race a duplicate (paid for like any
+        # request, and skipped if the buckets would make it wait) and keep
+        # whichever lands first
+        if not self._take_now(self._estimate_tokens(kwargs)):
+            return await primary
+        self.hedges += 1
+        backup = asyncio.ensure_future(self._create_once(kwargs))
+        pending = {primary, backup}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for loser in pending:
+                loser.cancel()
+                loser.add_done_callback(self._discard)
+
+    @staticmethod
+    def _discard(task: asyncio.Task):
+        """Close a losing hedge's stream if it completed before being cancelled"""
+        if task.cancelled() or task.exception() is not None:
+            return
+        result = task.result()
+        if hasattr(result, "close"):
+            asyncio.ensure_future(result.close())
+
+    async def _create_once(self, kwargs: dict):
+        started = time.monotonic()
+        raw = await self.client.chat.completions.with_raw_response.create(**kwargs)
+        self._last_used = time.monotonic()
+        self._latencies.append(time.monotonic() - started)
+        self._observe_headers(raw.headers)
+        return raw.parse()
+
+    def _hedge_delay(self) -> float:
+        """Hedge after the recent p95 time-to-headers, when there is spare capacity"""
+        if not self.hedge or len(self._latencies) < 20:
+            return None
+        if self._in_flight * 2 > self.max_in_flight or self._paused_until > time.monotonic():
+            return None
+        latencies = sorted(self._latencies)
+        return max(self.hedge_min_delay, latencies[int(len(latencies) * 0.95) - 1])
+
+    def _observe_headers(self, headers):
+        self.requests.observe(headers.get("x-ratelimit-limit-requests"), headers.get("x-ratelimit-remaining-requests"))
+        self.tokens.observe(headers.get("x-ratelimit-limit-tokens"), headers.get("x-ratelimit-remaining-tokens"))
+
+    @staticmethod
+    def _retry_after(error) -> float:
+        response = getattr(error, "response", None)
+        if response is None:
+            return None
+        headers = response.headers
+        try:
+            if headers.get("retry-after-ms"):
+                return float(headers["retry-after-ms"]) / 1000.0
+            if headers.get("retry-after"):
+                return float(headers["retry-after"])
+        except ValueError:
+            pass
+        return None
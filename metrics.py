@@ -0,0 +1,185 @@
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import time
+from contextlib import contextmanager
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Histogram, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+from starlette.requests import Request
+from starlette.responses import Response
+
+
+def _setup_logger() -> logging.Logger:
+    """Leveled logger whose records are written by a background thread, not the event loop"""
+    log = logging.getLogger("chainlit_mvp")
+    log.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    log.propagate = False
+
+    if not log.handlers:
+        records = queue.SimpleQueue()
+        stream_handler = logging.StreamHandler()
+        stream_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+        listener = logging.handlers.QueueListener(records, stream_handler)
+        listener.start()
+        atexit.register(listener.stop)
+        log.addHandler(logging.handlers.QueueHandler(records))
+    return log
+
+
+logger = _setup_logger()
+
+# Latency buckets from fast local work up to slow multi-round LLM turns
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+
+TURN_PHASE_SECONDS = Histogram(
+    "chat_turn_phase_seconds",
+    "Wall time spent in each phase of a chat turn",
+    ["phase"],
+    buckets=LATENCY_BUCKETS
+)
+TOOL_CALL_SECONDS = Histogram(
+    "mcp_tool_call_seconds",
+    "Wall time of MCP tool calls by server and tool",
+    ["server", "tool", "outcome"],
+    buckets=LATENCY_BUCKETS
+)
+TIME_TO_FIRST_TOKEN_SECONDS = Histogram(
+    "llm_time_to_first_token_seconds",
+    "Time from sending a streamed completion to its first content token",
+    buckets=LATENCY_BUCKETS
+)
+LLM_TOKENS = Counter(
+    "llm_tokens_total",
+    "Tokens reported in Azure OpenAI usage",
+    ["kind"]
+)
+TURNS = Counter(
+    "chat_turns_total",
+    "Chat turns handled, by how they were answered",
+    ["path"]
+)
+OVERLAP_SAVED_SECONDS = Histogram(
+    "chat_overlap_saved_seconds",
+    "Wall time taken off a turn's critical path by work started ahead of time",
+    ["kind"],
+    buckets=LATENCY_BUCKETS
+)
+TOOL_PREFETCHES = Counter(
+    "tool_prefetch_total",
+    "Speculative tool prefetches, by whether the model went on to use them",
+    ["outcome"]
+)
+
+
+class BoundedLabel:
+    """Caps the distinct values of a label that users control (e.g. MCP server names).
+
+    The first `limit` values seen are kept as they are and later ones are
+    reported as "other", so the number of series stays bounded.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._values = set()
+
+    def __call__(self, value: str) -> str:
+        if value in self._values:
+            return value
+        if len(self._values) < self.limit:
+            self._values.add(value)
+            return value
+        return "other"
+
+
+_server_label = BoundedLabel(int(os.getenv("METRICS_MAX_SERVER_LABELS", "20")))
+_tool_label = BoundedLabel(int(os.getenv("METRICS_MAX_TOOL_LABELS", "200")))
+
+
+class ComponentStatsCollector:
+    """Exports counters that components already keep (cache hits, retries...) at scrape time"""
+
+    def __init__(self):
+        self.sources = {}
+
+    def collect(self):
+        family = GaugeMetricFamily("app_component_stat", "Live counters kept by app components", labels=["component", "stat"])
+        for component, read_stats in self.sources.items():
+            for stat, value in read_stats().items():
+                family.add_metric([component, stat], float(value))
+        yield family
+
+
+_component_stats = ComponentStatsCollector()
+REGISTRY.register(_component_stats)
+
+
+def register_stats(component: str, read_stats):
+    """Expose `read_stats()` (returning a dict of numbers) under the component's name"""
+    _component_stats.sources[component] = read_stats
+
+
+@contextmanager
+def span(phase: str):
+    """Time a phase of the current turn into the phase histogram"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        TURN_PHASE_SECONDS.labels(phase=phase).observe(elapsed)
+        logger.debug("phase %s took %.3fs", phase, elapsed)
+
+
+@contextmanager
+def tool_span(server: str, tool: str):
+    """Time a single MCP tool call, labelled with whether it succeeded"""
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        TOOL_CALL_SECONDS.labels(
+            server=_server_label(server),
+            tool=_tool_label(tool),
+            outcome=outcome
+        ).observe(time.perf_counter() - started)
+
+
+def record_usage(usage):
+    """Count prompt/completion tokens from an OpenAI `usage` object (may be None)"""
+    if usage is None:
+        return
+    LLM_TOKENS.labels(kind="prompt").inc(usage.prompt_tokens or 0)
+    LLM_TOKENS.labels(kind="completion").inc(usage.completion_tokens or 0)
+    cached = getattr(getattr(usage, "prompt_tokens_details", None), "cached_tokens", None)
+    if cached:
+        LLM_TOKENS.labels(kind="cached_prompt").inc(cached)
+
+
+def record_overlap(kind: str, started: float, finished: float, needed_at: float) -> float:
+    """Record how much of a piece of work ran before the turn needed its result.
+
+    The work ran from `started` to `finished` (None if still running) and was
+    needed at `needed_at`; all three are perf_counter() readings.
+    """
+    saved = min(needed_at if finished is None else finished, needed_at) - started
+    if saved > 0:
+        OVERLAP_SAVED_SECONDS.labels(kind=kind).observe(saved)
+    return saved
+
+
+async def metrics_endpoint(request: Request) -> Response:
+    """Prometheus scrape endpoint"""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+def mount_route(app, path: str, endpoint, methods: list = None):
+    """Add a route to the Chainlit FastAPI app ahead of its catch-all frontend route"""
+    if any(getattr(route, "path", None) == path for route in app.router.routes):
+        return
+    app.add_api_route(path, endpoint, methods=methods or ["GET"], include_in_schema=False)
+    app.router.routes.insert(0, app.router.routes.pop())
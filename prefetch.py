@@ -0,0 +1,60 @@
+import asyncio
+import json
+import time
+
+from metrics import TOOL_PREFETCHES, logger, record_overlap
+
+
+class ToolPrefetcher:
+    """Speculative tool calls for one turn, run while the first completion streams.
+
+    Prefetches go through the shared tool result cache, with empty arguments,
+    so only argument-free tools that have a cache TTL (read-only, not denied)
+    should be started. When the model then asks for the same call, the
+    regular tool path is served from the cache or joins the in-flight
+    prefetch; nothing is handed over explicitly. The prefetcher only keeps
+    the timing needed to report how much wall time each prefetch saved.
+    """
+
+    def __init__(self):
+        self._prefetches = {}  # tool name -> {"started", "finished", "ok"}
+
+    def start(self, tool_name: str, fetch):
+        """Run `fetch()` (a coroutine factory) in the background for `tool_name`"""
+        record = {"started": time.perf_counter(), "finished": None, "ok": False}
+
+        async def run():
+            try:
+                await fetch()
+                record["ok"] = True
+            except Exception as e:
+                logger.debug(f"Prefetch of '{tool_name}' failed: {str(e)}")
+            finally:
+                record["finished"] = time.perf_counter()
+
+        asyncio.ensure_future(run())
+        self._prefetches[tool_name] = record
+
+    def claim(self, tool_calls: list):
+        """Credit the prefetches that the model's tool calls are about to reuse"""
+        needed_at = time.perf_counter()
+        for tool_call in tool_calls:
+            record = self._prefetches.get(tool_call["function"]["name"])
+            if record is None or (record["finished"] is not None and not record["ok"]):
+                continue
+            try:
+                arguments = json.loads(tool_call["function"]["arguments"] or "{}")
+            except ValueError:
+                continue
+            if arguments:
+                continue
+            del self._prefetches[tool_call["function"]["name"]]
+            TOOL_PREFETCHES.labels(outcome="used").inc()
+            record_overlap("tool_prefetch", record["started"], record["finished"], needed_at)
+
+    def finish(self):
+        """Count prefetches the turn never used (successful ones stay in the cache)"""
+        for record in self._prefetches.values():
+            failed = record["finished"] is not None and not record["ok"]
+            TOOL_PREFETCHES.labels(outcome="failed" if failed else "unused").inc()
+        self._prefetches.clear()
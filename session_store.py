@@ -0,0 +1,123 @@
+import json
+import time
+from abc import ABC, abstractmethod
+
+try:
+    import msgpack
+except ImportError:  # JSON fallback; msgpack is listed in requirements.txt
+    msgpack = None
+
+
+def pack(value) -> bytes:
+    """Serialize session state compactly (msgpack when available)"""
+    if msgpack is not None:
+        return msgpack.packb(value, use_bin_type=True)
+    return json.dumps(value, separators=(",", ":"), default=str).encode()
+
+
+def unpack(data: bytes):
+    """Inverse of `pack`; also reads JSON written by a worker without msgpack"""
+    if data[:1] in (b"{", b"["):
+        return json.loads(data)
+    return msgpack.unpackb(data, raw=False)
+
+
+class SessionStore(ABC):
+    """Key/value backend for state that must outlive a worker's memory.
+
+    Values are bytes (see `pack`/`unpack`). `shared` tells whether other
+    workers see the same data, i.e. whether it is worth sharing caches such
+    as tool catalogs through it.
+    """
+
+    shared = False
+
+    @abstractmethod
+    async def get(self, key: str) -> bytes:
+        """Value stored under `key`, or None"""
+
+    @abstractmethod
+    async def set_many(self, items: dict, ttl: float = None):
+        """Write several keys in one round trip"""
+
+    async def set(self, key: str, value: bytes, ttl: float = None):
+        await self.set_many({key: value}, ttl)
+
+    @abstractmethod
+    async def delete(self, key: str):
+        """Remove `key` if present"""
+
+    async def ping(self) -> bool:
+        return True
+
+    async def close(self):
+        pass
+
+
+class InMemorySessionStore(SessionStore):
+    """Per-process store: state survives reconnects to this worker but not a restart"""
+
+    def __init__(self):
+        self._data = {}  # key -> (expires_at or None, value)
+
+    async def get(self, key: str) -> bytes:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry[0] is not None and entry[0] <= time.monotonic():
+            del self._data[key]
+            return None
+        return entry[1]
+
+    async def set_many(self, items: dict, ttl: float = None):
+        expires_at = time.monotonic() + ttl if ttl else None
+        for key, value in items.items():
+            self._data[key] = (expires_at, value)
+        self._prune()
+
+    async def delete(self, key: str):
+        self._data.pop(key, None)
+
+    def _prune(self):
+        now = time.monotonic()
+        for key in [key for key, (expires_at, _) in self._data.items() if expires_at is not None and expires_at <= now]:
+            del self._data[key]
+
+
+class RedisSessionStore(SessionStore):
+    """Store on any server speaking the Redis protocol (Redis, Valkey, ElastiCache...)"""
+
+    shared = True
+
+    def __init__(self, url: str, prefix: str = "chainlit:"):
+        import redis.asyncio as redis  # only needed when this backend is configured
+
+        self.client = redis.from_url(url)
+        self.prefix = prefix
+
+    async def get(self, key: str) -> bytes:
+        return await self.client.get(self.prefix + key)
+
+    async def set_many(self, items: dict, ttl: float = None):
+        async with self.client.pipeline(transaction=False) as pipe:
+            for key, value in items.items():
+                pipe.set(self.prefix + key, value, px=int(ttl * 1000) if ttl else None)
+            await pipe.execute()
+
+    async def delete(self, key: str):
+        await self.client.delete(self.prefix + key)
+
+    async def ping(self) -> bool:
+        return bool(await self.client.ping())
+
+    async def close(self):
+        await self.client.aclose()
+
+
+def create_session_store(url: str) -> SessionStore:
+    """Build the backend named by SESSION_STORE_URL (empty or memory:// for in-process)"""
+    if not url or url.startswith("memory://"):
+        return InMemorySessionStore()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisSessionStore(url)
+    raise Exception(f"Unsupported session store URL: {url}")
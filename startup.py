@@ -0,0 +1,92 @@
+import asyncio
+import time
+
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+
+from metrics import logger
+
+# Import-to-ready timing starts here: app.py imports this module first, so it
+# covers loading the app and its dependencies, then warmup
+IMPORT_STARTED = time.perf_counter()
+
+
+class StartupState:
+    """Readiness of this worker.
+
+    The worker is ready once its warmup steps have run (whether or not they
+    succeeded: a failed step only means the first users pay for it) and
+    there are no configuration problems. Live `checks` (async callables
+    returning a bool) are evaluated on every readiness probe.
+    """
+
+    def __init__(self):
+        self.ready_at = None
+        self.steps = {}      # warmup step -> outcome text
+        self.problems = []   # configuration problems
+        self.checks = {}     # name -> async callable returning True when healthy
+        self.task = None
+        self._ready = asyncio.Event()
+
+    @property
+    def import_to_ready(self) -> float:
+        """Seconds from the start of app import to the end of warmup, or None while warming up"""
+        return self.ready_at - IMPORT_STARTED if self.ready_at is not None else None
+
+    def mark_ready(self):
+        self.ready_at = time.perf_counter()
+        self._ready.set()
+        logger.info(f"Worker ready {self.import_to_ready:.2f}s after import")
+
+    async def wait_ready(self):
+        await self._ready.wait()
+
+    def start_warmup(self, steps: dict, timeout: float):
+        """Run `steps` (name -> coroutine factory) concurrently in the background, then mark ready"""
+        self.task = asyncio.ensure_future(self._warm_up(steps, timeout))
+
+    async def _warm_up(self, steps: dict, timeout: float):
+        async def run(name: str, step):
+            started = time.perf_counter()
+            try:
+                await asyncio.wait_for(step(), timeout=timeout)
+                self.steps[name] = f"ok in {time.perf_counter() - started:.2f}s"
+            except Exception as e:
+                self.steps[name] = f"failed: {str(e) or type(e).__name__}"
+                logger.warning(f"Warmup step '{name}' failed: {str(e) or type(e).__name__}")
+
+        await asyncio.gather(*(run(name, step) for name, step in steps.items()))
+        self.mark_ready()
+
+
+startup_state = StartupState()
+
+
+async def health_endpoint(request: Request) -> JSONResponse:
+    """Readiness probe: 200 once warmed up and healthy, 503 otherwise"""
+    checks = {}
+    for name, check in startup_state.checks.items():
+        try:
+            checks[name] = bool(await asyncio.wait_for(check(), timeout=2.0))
+        except Exception:
+            checks[name] = False
+
+    if startup_state.problems:
+        status = "misconfigured"
+    elif startup_state.ready_at is None:
+        status = "starting"
+    elif not all(checks.values()):
+        status = "degraded"
+    else:
+        status = "ready"
+
+    return JSONResponse(
+        {
+            "status": status,
+            "import_to_ready_seconds": startup_state.import_to_ready,
+            "warmup": startup_state.steps,
+            "checks": checks,
+            "problems": startup_state.problems
+        },
+        status_code=200 if status == "ready" else 503
+    )
@@ -0,0 +1,67 @@
+import time
+
+import chainlit as cl
+
+from metrics import TIME_TO_FIRST_TOKEN_SECONDS, record_usage
+
+
+def _merge_tool_call_delta(tool_calls: dict, delta) -> None:
+    """Accumulate a streamed tool call fragment into `tool_calls` (keyed by index)"""
+    entry = tool_calls.setdefault(delta.index, {
+        "id": None,
+        "type": "function",
+        "function": {"name": "", "arguments": ""}
+    })
+    if delta.id:
+        entry["id"] = delta.id
+    if delta.function is not None:
+        if delta.function.name:
+            entry["function"]["name"] += delta.function.name
+        if delta.function.arguments:
+            entry["function"]["arguments"] += delta.function.arguments
+
+
+async def stream_completion(llm, msg: cl.Message = None, **kwargs) -> tuple[str, list, bool]:
+    """Stream a chat completion from the LLM gateway into `msg` token by token.
+
+    Text deltas are pushed to the UI as they arrive. Native tool call deltas
+    are never shown; their fragments are assembled into complete
+    OpenAI-format `tool_calls` entries ready to be echoed back to the model.
+
+    Returns the full reply text, the list of tool calls (possibly empty) and
+    whether any text was streamed to the UI.
+    """
+    parts = []
+    tool_calls = {}
+    streamed = False
+
+    started = time.perf_counter()
+    stream = await llm.create(stream=True, stream_options={"include_usage": True}, **kwargs)
+    async for chunk in stream:
+        # The final chunk carries token usage and no choices
+        if getattr(chunk, "usage", None) is not None:
+            record_usage(chunk.usage)
+        # Azure sends prompt-filter chunks with no choices before the first token
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta
+
+        for tool_delta in delta.tool_calls or []:
+            _merge_tool_call_delta(tool_calls, tool_delta)
+
+        token = delta.content
+        if not token:
+            continue
+        if not parts:
+            TIME_TO_FIRST_TOKEN_SECONDS.observe(time.perf_counter() - started)
+        parts.append(token)
+
+        if msg is not None:
+            if not streamed:
+                token = token.lstrip()
+                if not token:
+                    continue
+            streamed = True
+            await msg.stream_token(token)
+
+    return "".join(parts).strip(), [tool_calls[i] for i in sorted(tool_calls)], streamed
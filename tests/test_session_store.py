@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+import pytest_asyncio
+
+from benchmark import FakeRedis, start_fake_redis
+from history import ConversationHistory
+from session_store import RedisSessionStore, pack, unpack
+
+
+@pytest.fixture(scope="module")
+def redis_server():
+    fake = FakeRedis()
+    return fake, start_fake_redis(fake)
+
+
+@pytest_asyncio.fixture
+async def store(redis_server):
+    store = RedisSessionStore(redis_server[1], prefix="test:")
+    yield store
+    await store.close()
+
+
+def test_pack_round_trip():
+    value = {"summary": "", "entries": [{"role": "user", "content": "héllo", "tokens": 5}], "message_count": 1}
+    assert unpack(pack(value)) == value
+
+
+def test_unpack_reads_json():
+    assert unpack(b'{"message_count": 3}') == {"message_count": 3}
+
+
+@pytest.mark.asyncio
+async def test_redis_round_trip(store, redis_server):
+    await store.set_many({"a": pack({"n": 1}), "b": pack([1, 2])})
+    assert unpack(await store.get("a")) == {"n": 1}
+    assert unpack(await store.get("b")) == [1, 2]
+    assert b"test:a" in redis_server[0].data
+
+    await store.delete("a")
+    assert await store.get("a") is None
+    assert await store.ping()
+
+
+@pytest.mark.asyncio
+async def test_redis_ttl_expires(store):
+    await store.set("short", b"x", ttl=0.05)
+    await store.set("long", b"y", ttl=60)
+    assert await store.get("short") == b"x"
+    await asyncio.sleep(0.1)
+    assert await store.get("short") is None
+    assert await store.get("long") == b"y"
+
+
+@pytest.mark.asyncio
+async def test_history_survives_the_store(store):
+    history = ConversationHistory(budget_tokens=1000)
+    history.add("user", "What's the weather in Paris?")
+    history.add("assistant", "Sunny.", tool_info={"tool_name": "get_weather"})
+    history.summary = "Earlier: greetings."
+
+    await store.set("session", pack(history.to_state()), ttl=60)
+    restored = ConversationHistory.from_state(unpack(await store.get("session")), budget_tokens=1000)
+
+    assert restored.summary == history.summary
+    assert restored.message_count == 2
+    assert restored.entries == history.entries
+    assert restored.window() == history.window()
@@ -0,0 +1,85 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from tool_cache import ToolResultCache, cache_key
+
+
+def counting_call(result=None, delay=0.0):
+    calls = []
+
+    async def call():
+        calls.append(1)
+        await asyncio.sleep(delay)
+        return result if result is not None else SimpleNamespace(isError=False, n=len(calls))
+
+    return call, calls
+
+
+def test_cache_key_ignores_parameter_order():
+    assert cache_key("s", "t", {"a": 1, "b": 2}) == cache_key("s", "t", {"b": 2, "a": 1})
+    assert cache_key("s", "t", {"a": 1}) != cache_key("other", "t", {"a": 1})
+
+
+def test_ttl_for():
+    cache = ToolResultCache(default_ttl=60, tool_ttls={"slow": 5, "off": 0}, deny={"send"})
+    assert cache.ttl_for({"name": "slow"}) == 5
+    assert cache.ttl_for({"name": "off", "read_only": True}) is None
+    assert cache.ttl_for({"name": "send", "read_only": True}) is None
+    assert cache.ttl_for({"name": "read", "read_only": True}) == 60
+    assert cache.ttl_for({"name": "write"}) is None
+
+
+@pytest.mark.asyncio
+async def test_hit_until_ttl_expires():
+    cache = ToolResultCache()
+    call, calls = counting_call()
+
+    first = await cache.get_or_call("s", "t", {"q": 1}, 0.05, call)
+    assert await cache.get_or_call("s", "t", {"q": 1}, 0.05, call) is first
+    assert (len(calls), cache.hits, cache.misses) == (1, 1, 1)
+
+    await asyncio.sleep(0.1)
+    assert await cache.get_or_call("s", "t", {"q": 1}, 0.05, call) is not first
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_coalesce():
+    cache = ToolResultCache()
+    call, calls = counting_call(delay=0.02)
+
+    results = await asyncio.gather(*(cache.get_or_call("s", "t", {}, 60, call) for _ in range(5)))
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+    assert cache.coalesced == 4
+
+
+@pytest.mark.asyncio
+async def test_errors_and_uncacheable_tools_are_not_stored():
+    cache = ToolResultCache()
+    call, calls = counting_call(result=SimpleNamespace(isError=True))
+    await cache.get_or_call("s", "t", {}, 60, call)
+    await cache.get_or_call("s", "t", {}, 60, call)
+    assert len(calls) == 2
+
+    call, calls = counting_call()
+    await cache.get_or_call("s", "t", {}, None, call)
+    await cache.get_or_call("s", "t", {}, None, call)
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_lru_bound_and_invalidate():
+    cache = ToolResultCache(max_entries=2)
+    for n in range(3):
+        call, _ = counting_call()
+        await cache.get_or_call("s", "t", {"n": n}, 60, call)
+    assert len(cache._entries) == 2
+    assert cache_key("s", "t", {"n": 0}) not in cache._entries
+
+    call, _ = counting_call()
+    await cache.get_or_call("other", "t", {}, 60, call)
+    cache.invalidate("s")
+    assert list(cache._entries) == [cache_key("other", "t", {})]
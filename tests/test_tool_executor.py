@@ -0,0 +1,78 @@
+import asyncio
+import time
+
+import pytest
+
+from tool_executor import CircuitBreaker, ToolExecutor
+
+
+def test_breaker_opens_after_threshold():
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=60)
+    assert breaker.allow()
+    assert not breaker.record_failure()
+    assert breaker.record_failure()
+    assert breaker.is_open and breaker.rejecting
+    assert not breaker.allow()
+    assert breaker.retry_in() > 0
+
+
+def test_breaker_lets_one_probe_through_after_cooldown():
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0.01)
+    breaker.record_failure()
+    time.sleep(0.02)
+
+    assert not breaker.is_open
+    assert breaker.allow()
+    assert breaker.rejecting
+    assert not breaker.allow()
+
+    breaker.record_success()
+    assert not breaker.rejecting
+    assert breaker.allow()
+
+
+def test_failed_probe_reopens_and_released_probe_retries():
+    breaker = CircuitBreaker(failure_threshold=3, reset_seconds=0.01)
+    for _ in range(3):
+        breaker.record_failure()
+    time.sleep(0.02)
+
+    assert breaker.allow()
+    assert breaker.record_failure()
+    assert breaker.is_open
+
+    time.sleep(0.02)
+    assert breaker.allow()
+    breaker.release_probe()
+    assert breaker.allow()
+
+
+@pytest.mark.asyncio
+async def test_executor_rejects_while_open():
+    executor = ToolExecutor(failure_threshold=1, reset_seconds=60)
+
+    async def broken():
+        raise RuntimeError("down")
+
+    with pytest.raises(RuntimeError):
+        await executor.run("server", "tool", broken)
+    assert executor.open_servers() == {"server"}
+    with pytest.raises(Exception, match="temporarily unavailable"):
+        await executor.run("server", "tool", broken)
+    assert executor.rejected == 1
+
+
+@pytest.mark.asyncio
+async def test_queue_timeout_is_a_rejection_not_a_failure():
+    executor = ToolExecutor(max_per_server=1, min_timeout=0.1, max_timeout=0.2)
+
+    async def slow():
+        await asyncio.sleep(0.15)
+        return "ok"
+
+    results = await asyncio.gather(*(executor.run("server", "tool", slow) for _ in range(3)), return_exceptions=True)
+    assert results[0] == "ok"
+    assert all("busy" in str(result) for result in results[1:])
+    assert executor.rejected == 2
+    assert executor.breaker("server").failures == 0
+    assert executor.in_flight == 0
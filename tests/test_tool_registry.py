@@ -0,0 +1,63 @@
+import pytest
+
+from tool_registry import ToolRegistry
+
+
+def tools(server, *names):
+    return [{"name": name, "description": name, "input_schema": None, "server": server} for name in names]
+
+
+def test_first_server_keeps_colliding_names():
+    registry = ToolRegistry()
+    registry.add_session("a", object())
+    registry.add_session("b", object())
+    assert registry.add_tools("a", tools("a", "search", "fetch")) == []
+    assert registry.add_tools("b", tools("b", "search", "post")) == ["search"]
+
+    assert registry.resolve("search")[0] == "a"
+    assert registry.collisions == {"search": ["b"]}
+    assert [tool["name"] for tool in registry.tools] == ["fetch", "post", "search"]
+
+
+def test_shadowed_tool_takes_over_when_owner_leaves():
+    registry = ToolRegistry()
+    registry.add_session("a", object())
+    registry.add_session("b", object())
+    registry.add_tools("a", tools("a", "search"))
+    registry.add_tools("b", tools("b", "search"))
+
+    registry.remove_server("a")
+    assert registry.resolve("search")[0] == "b"
+    assert registry.collisions == {}
+
+    registry.remove_server("b")
+    with pytest.raises(Exception, match="not found"):
+        registry.resolve("search")
+
+
+def test_refresh_keeps_owned_routes():
+    registry = ToolRegistry()
+    registry.add_session("a", object())
+    registry.add_session("b", object())
+    registry.add_tools("a", tools("a", "search"))
+    registry.add_tools("b", tools("b", "search"))
+
+    # Re-adding the owner (catalog refresh) must not hand the route to "b"
+    registry.add_tools("a", tools("a", "search", "fetch"))
+    assert registry.resolve("search")[0] == "a"
+
+    # Dropping the tool from the owner's catalog promotes the shadowed copy
+    registry.add_tools("a", tools("a", "fetch"))
+    assert registry.resolve("search")[0] == "b"
+
+
+def test_unavailable_servers_are_hidden_but_routed():
+    registry = ToolRegistry()
+    registry.add_session("a", object())
+    registry.add_tools("a", tools("a", "search"))
+    version = registry.version
+
+    registry.set_unavailable({"a"})
+    assert registry.tools == [] and registry.openai_schemas == []
+    assert registry.resolve("search")[0] == "a"
+    assert registry.version > version
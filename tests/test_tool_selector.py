@@ -0,0 +1,62 @@
+import numpy as np
+
+from tool_selector import HashingEmbedder, ToolSelector
+
+TOOLS = [
+    {"name": "get_weather", "description": "Current weather forecast for a city"},
+    {"name": "search_news", "description": "Search recent news articles"},
+    {"name": "list_jobs", "description": "Open job postings"},
+    {"name": "send_email", "description": "Send an email message"},
+    {"name": "get_events", "description": "Upcoming events in a city"},
+]
+
+
+class CountingEmbedder(HashingEmbedder):
+    def __init__(self, dim: int = 64):
+        super().__init__(dim)
+        self.embedded = 0
+
+    def embed(self, texts: list) -> np.ndarray:
+        self.embedded += len(texts)
+        return super().embed(texts)
+
+
+def test_hashing_embedder_is_deterministic():
+    texts = ["weather in Paris", "news about jobs", ""]
+    first = HashingEmbedder().embed(texts)
+    second = HashingEmbedder().embed(texts)
+    assert first.dtype == np.float32 and first.shape == (3, 512)
+    assert np.array_equal(first, second)
+    assert np.allclose(np.linalg.norm(first[:2], axis=1), 1.0)
+    assert not first[2].any()
+
+
+def test_small_catalogs_are_not_filtered():
+    selector = ToolSelector(TOOLS, top_k=5)
+    assert selector.select("anything") is TOOLS
+
+
+def test_top_k_in_catalog_order():
+    selector = ToolSelector(TOOLS, top_k=2)
+    chosen = selector.select("what is the weather forecast in Paris")
+    assert len(chosen) == 2
+    assert TOOLS[0] in chosen
+    assert chosen == [tool for tool in TOOLS if tool in chosen]
+
+
+def test_always_tools_are_added():
+    selector = ToolSelector(TOOLS, top_k=1)
+    chosen = selector.select("weather forecast", always=["send_email"])
+    assert [tool["name"] for tool in chosen] == ["get_weather", "send_email"]
+
+
+def test_catalog_is_embedded_once_per_digest():
+    embedder = CountingEmbedder()
+    first = ToolSelector(TOOLS, embedder=embedder, top_k=2)
+    second = ToolSelector([dict(tool) for tool in TOOLS], embedder=CountingEmbedder(), top_k=2)
+    assert second.matrix is first.matrix
+    assert embedder.embedded == len(TOOLS)
+
+    changed = TOOLS[:4] + [{"name": "get_events", "description": "Concerts and festivals"}]
+    assert ToolSelector(changed, embedder=embedder, top_k=2).matrix is not first.matrix
+    assert embedder.embedded == 2 * len(TOOLS)
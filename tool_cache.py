@@ -0,0 +1,98 @@
+import asyncio
+import json
+import time
+from collections import OrderedDict
+
+
+def parse_tool_ttls(spec: str) -> dict:
+    """Parse a `tool=seconds,tool=seconds` spec into a dict of per-tool TTLs"""
+    ttls = {}
+    for item in (spec or "").split(","):
+        name, _, seconds = item.strip().partition("=")
+        if name and seconds:
+            ttls[name.strip()] = float(seconds)
+    return ttls
+
+
+def cache_key(server: str, tool_name: str, parameters: dict) -> str:
+    """Build a cache key that ignores parameter ordering and whitespace"""
+    canonical = json.dumps(parameters or {}, sort_keys=True, separators=(",", ":"), default=str)
+    return f"{server}\x00{tool_name}\x00{canonical}"
+
+
+class ToolResultCache:
+    """TTL + LRU cache in front of MCP tool calls, shared by every session in a worker.
+
+    Entries are keyed by `catalog_cache.result_scope`. Only tools that are
+    safe to replay are cached. A tool is cacheable if it has an explicit TTL
+    in `tool_ttls`, or if the server annotates it as read-only (in which case
+    `default_ttl` applies). Tools listed in `deny` are never cached. Concurrent identical calls are collapsed onto a single
+    in-flight request; failures are never cached.
+    """
+
+    def __init__(self, max_entries: int = 512, default_ttl: float = 60.0, tool_ttls: dict = None, deny: set = None):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.tool_ttls = tool_ttls or {}
+        self.deny = deny or set()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._entries = OrderedDict()  # key -> (expires_at, result)
+        self._inflight = {}            # key -> asyncio.Task
+
+    def ttl_for(self, tool: dict) -> float:
+        """Get the TTL for a tool, or None if its results must not be cached"""
+        name = tool["name"]
+        if name in self.deny:
+            return None
+        if name in self.tool_ttls:
+            return self.tool_ttls[name] or None
+        if tool.get("read_only"):
+            return self.default_ttl
+        return None
+
+    async def get_or_call(self, server: str, tool_name: str, parameters: dict, ttl: float, call):
+        """Return a cached result or run `call()` (a coroutine factory) to produce one"""
+        if not ttl:
+            return await call()
+
+        key = cache_key(server, tool_name, parameters)
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            del self._entries[key]
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            task = asyncio.ensure_future(self._fill(key, ttl, call))
+            self._inflight[key] = task
+        # Shield so one caller being cancelled does not cancel the shared call
+        return await asyncio.shield(task)
+
+    def invalidate(self, server: str = None):
+        """Drop cached results, for one server identity or all of them"""
+        if server is None:
+            self._entries.clear()
+            return
+        prefix = f"{server}\x00"
+        for key in [key for key in self._entries if key.startswith(prefix)]:
+            del self._entries[key]
+
+    async def _fill(self, key: str, ttl: float, call):
+        try:
+            result = await call()
+            if not getattr(result, "isError", False):
+                self._entries[key] = (time.monotonic() + ttl, result)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            return result
+        finally:
+            self._inflight.pop(key, None)
@@ -0,0 +1,204 @@
+import asyncio
+import time
+from collections import deque
+
+from metrics import logger
+
+
+class CircuitBreaker:
+    """Per-server breaker: opens after consecutive failures, probes once after a cooldown"""
+
+    def __init__(self, failure_threshold: int = 3, reset_seconds: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    @property
+    def is_open(self) -> bool:
+        """Open and still cooling down (calls are rejected, tools are hidden)"""
+        return self.opened_at is not None and time.monotonic() - self.opened_at < self.reset_seconds
+
+    @property
+    def rejecting(self) -> bool:
+        """Open, or half-open with its probe in flight: either way other calls are rejected"""
+        return self.is_open or self._probing
+
+    def retry_in(self) -> float:
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self.reset_seconds - (time.monotonic() - self.opened_at))
+
+    def allow(self) -> bool:
+        """Whether a call may go through now; after the cooldown only one probe is let through"""
+        if self.opened_at is None:
+            return True
+        if self.is_open or self._probing:
+            return False
+        self._probing = True
+        return True
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def release_probe(self):
+        """Let another probe through when one ended without a verdict (e.g. cancelled)"""
+        self._probing = False
+
+    def record_failure(self) -> bool:
+        """Count a failure; returns True if this opened (or re-opened) the circuit"""
+        self.failures += 1
+        if self._probing or self.failures >= self.failure_threshold:
+            self._probing = False
+            self.opened_at = time.monotonic()
+            return True
+        return False
+
+
+class ToolExecutor:
+    """Worker-wide guard around MCP tool calls, keyed by server identity.
+
+    Each call waits for one of `max_per_server` slots on its server, so a
+    burst from one session cannot monopolize a shared server. Waiting for the
+    slot and the call itself share one deadline, learned from recent
+    latencies: `timeout_multiplier` times the p99 of the tool (or, until it
+    has enough samples, of its server), clamped to [min_timeout, max_timeout].
+    A call that queueing left with less than `min_timeout` and that then
+    runs out of time is rejected without counting against the server: the
+    queue is ours, not the server's fault. Exceptions, and timeouts of calls
+    that had a fair budget, count against the server's
+    circuit breaker; while it is open, calls fail immediately and
+    `open_servers()` reports the server so its tools can be hidden from the
+    prompt. Tool-level error results (`isError`) mean the server answered and
+    count as successes. Servers are keyed by `catalog_cache.result_scope`.
+    """
+
+    def __init__(
+        self,
+        max_per_server: int = 8,
+        min_timeout: float = 2.0,
+        max_timeout: float = 30.0,
+        timeout_multiplier: float = 3.0,
+        min_samples: int = 10,
+        failure_threshold: int = 3,
+        reset_seconds: float = 30.0
+    ):
+        self.max_per_server = max_per_server
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.timeout_multiplier = timeout_multiplier
+        self.min_samples = min_samples
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.timeouts = 0
+        self.rejected = 0
+        self.in_flight = 0
+        self._semaphores = {}            # server identity -> asyncio.Semaphore
+        self._breakers = {}              # server identity -> CircuitBreaker
+        self._latencies = {}             # (server, tool) or (server, None) -> deque of seconds
+
+    def breaker(self, server: str) -> CircuitBreaker:
+        breaker = self._breakers.get(server)
+        if breaker is None:
+            breaker = self._breakers[server] = CircuitBreaker(self.failure_threshold, self.reset_seconds)
+        return breaker
+
+    def open_servers(self) -> set:
+        """Servers whose calls are currently rejected: circuit open, or half-open while probing"""
+        return {server for server, breaker in self._breakers.items() if breaker.rejecting}
+
+    def forget(self, server: str):
+        """Drop the state kept for a server, e.g. a per-connection identity that is gone"""
+        self._semaphores.pop(server, None)
+        self._breakers.pop(server, None)
+        for key in [key for key in self._latencies if key[0] == server]:
+            del self._latencies[key]
+
+    def timeout_for(self, server: str, tool_name: str) -> float:
+        """Current timeout budget for a tool, learned from its (or its server's) latencies"""
+        for key in ((server, tool_name), (server, None)):
+            samples = self._latencies.get(key)
+            if samples is not None and len(samples) >= self.min_samples:
+                ordered = sorted(samples)
+                p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+                return min(self.max_timeout, max(self.min_timeout, p99 * self.timeout_multiplier))
+        return self.max_timeout
+
+    async def run(self, server: str, tool_name: str, call, label: str = None):
+        """Run `call()` (a coroutine factory) under the server's concurrency, timeout and breaker.
+
+        `server` is the server identity; `label` (the connection name) is what messages show.
+        """
+        label = label or server
+        breaker = self.breaker(server)
+        if not breaker.allow():
+            self.rejected += 1
+            raise Exception(
+                f"Server '{label}' is temporarily unavailable after repeated failures "
+                f"(retrying in {breaker.retry_in():.0f}s)"
+            )
+
+        semaphore = self._semaphores.get(server)
+        if semaphore is None:
+            semaphore = self._semaphores[server] = asyncio.Semaphore(self.max_per_server)
+
+        timeout = self.timeout_for(server, tool_name)
+        deadline = time.monotonic() + timeout
+        try:
+            await asyncio.wait_for(semaphore.acquire(), timeout=timeout)
+        except asyncio.TimeoutError:
+            raise self._reject(label, tool_name, timeout, breaker)
+        except asyncio.CancelledError:
+            breaker.release_probe()
+            raise
+
+        try:
+            self.in_flight += 1
+            started = time.monotonic()
+            budget = deadline - started
+            try:
+                result = await asyncio.wait_for(call(), timeout=max(0.0, budget))
+                self._observe(server, tool_name, time.monotonic() - started)
+            finally:
+                self.in_flight -= 1
+                semaphore.release()
+        except asyncio.TimeoutError:
+            if budget < self.min_timeout:
+                raise self._reject(label, tool_name, timeout, breaker)
+            # Recorded at the budget so a server that got slower widens it
+            self._observe(server, tool_name, budget)
+            self.timeouts += 1
+            self._fail(label, breaker)
+            raise Exception(f"Tool '{tool_name}' timed out after {timeout:.1f} seconds")
+        except asyncio.CancelledError:
+            # Cancelled by the user or the turn: says nothing about the server
+            breaker.release_probe()
+            raise
+        except Exception:
+            self._fail(label, breaker)
+            raise
+
+        breaker.record_success()
+        return result
+
+    def _reject(self, label: str, tool_name: str, timeout: float, breaker: CircuitBreaker) -> Exception:
+        self.rejected += 1
+        breaker.release_probe()
+        return Exception(
+            f"Server '{label}' is busy: '{tool_name}' spent its {timeout:.1f} second budget "
+            f"waiting for a free slot"
+        )
+
+    def _fail(self, label: str, breaker: CircuitBreaker):
+        if breaker.record_failure():
+            logger.warning(f"Circuit opened for MCP server '{label}'; its tools are hidden for {breaker.reset_seconds:.0f}s")
+
+    def _observe(self, server: str, tool_name: str, elapsed: float):
+        for key in ((server, tool_name), (server, None)):
+            samples = self._latencies.get(key)
+            if samples is None:
+                samples = self._latencies[key] = deque(maxlen=200)
+            samples.append(elapsed)
@@ -0,0 +1,131 @@
+from mcp import ClientSession
+
+
+def to_openai_schema(tool: dict) -> dict:
+    """Convert an MCP tool definition into an OpenAI `tools=` function schema"""
+    return {
+        "type": "function",
+        "function": {
+            "name": tool["name"],
+            "description": tool["description"] or "",
+            "parameters": tool["input_schema"] or {"type": "object", "properties": {}}
+        }
+    }
+
+
+class ToolRegistry:
+    """Per-session index of connected MCP servers and the tools they expose.
+
+    Updated incrementally from the MCP connect/disconnect hooks so that the
+    per-message paths (routing a tool call, listing tools, building OpenAI
+    schemas) are dictionary lookups or precomputed lists.
+
+    `version` is bumped on every catalog change so derived artifacts such as
+    the rendered system prompt can be cached against it. The flat lists are
+    kept sorted by tool name so that their serialized form is byte-stable
+    regardless of server connection order.
+    """
+
+    def __init__(self):
+        self.sessions = {}          # server name -> ClientSession
+        self.identities = {}        # server name -> key for worker-wide tool state (result cache...)
+        self.tools_by_server = {}   # server name -> list of tool dicts
+        self.collisions = {}        # tool name -> servers whose copy is shadowed
+        self.tools = []             # flat list of routable, available tools (shared, read-only dicts)
+        self.openai_schemas = []    # OpenAI function schemas, same order as self.tools
+        self.tools_by_name = {}     # tool name -> routed tool dict (including hidden ones)
+        self._routes = {}           # tool name -> server name
+        self.unavailable = set()    # servers whose tools are hidden from the prompt
+        self.version = 0
+
+    def add_session(self, server_name: str, session: ClientSession, identity: str = None):
+        """Register (or replace) the live session for a server, with its `catalog_cache.result_scope`"""
+        self.sessions[server_name] = session
+        self.identities[server_name] = identity or server_name
+
+    def identity(self, server_name: str) -> str:
+        return self.identities.get(server_name, server_name)
+
+    def add_tools(self, server_name: str, tools: list) -> list:
+        """Register a server's tools; returns the names shadowed by another server.
+
+        The first server to expose a tool name keeps the route. Later servers
+        exposing the same name are recorded in `collisions` and take over only
+        if the owning server disconnects or stops exposing the tool. Adding a
+        server again (e.g. after a catalog refresh) keeps the routes it owns.
+        """
+        previous = self.tools_by_server.get(server_name, [])
+        names = {tool["name"] for tool in tools}
+        self.tools_by_server[server_name] = tools
+        self._drop_tools(server_name, [tool for tool in previous if tool["name"] not in names])
+
+        shadowed = []
+        for tool in tools:
+            owner = self._routes.get(tool["name"])
+            if owner is not None and owner != server_name:
+                servers = self.collisions.setdefault(tool["name"], [])
+                if server_name not in servers:
+                    servers.append(server_name)
+                shadowed.append(tool["name"])
+                continue
+            self._routes[tool["name"]] = server_name
+
+        self._rebuild()
+        return shadowed
+
+    def remove_server(self, server_name: str):
+        """Forget a server's tools and session, promoting any shadowed tools"""
+        self.sessions.pop(server_name, None)
+        self.identities.pop(server_name, None)
+        tools = self.tools_by_server.pop(server_name, [])
+        if not tools:
+            return
+        self._drop_tools(server_name, tools)
+        self._rebuild()
+
+    def set_unavailable(self, server_names: set):
+        """Hide the tools of unhealthy servers from `tools`/`openai_schemas` (routing is unchanged)"""
+        server_names = set(server_names) & set(self.tools_by_server)
+        if server_names != self.unavailable:
+            self.unavailable = server_names
+            self._rebuild()
+
+    def resolve(self, tool_name: str) -> tuple[str, ClientSession]:
+        """Find which MCP server (and session) provides a specific tool"""
+        server_name = self._routes.get(tool_name)
+        if server_name is None:
+            raise Exception(f"Tool '{tool_name}' not found in any connected MCP server")
+        session = self.sessions.get(server_name)
+        if session is None:
+            raise Exception(f"Tool '{tool_name}' found but server '{server_name}' is not connected")
+        return server_name, session
+
+    def _drop_tools(self, server_name: str, tools: list):
+        for tool in tools:
+            name = tool["name"]
+            if self._routes.get(name) == server_name:
+                del self._routes[name]
+            elif server_name in self.collisions.get(name, []):
+                self.collisions[name].remove(server_name)
+
+        # Hand orphaned tool names to the next server that exposes them
+        for name, servers in list(self.collisions.items()):
+            if name not in self._routes and servers:
+                self._routes[name] = servers.pop(0)
+            if not servers:
+                del self.collisions[name]
+
+    def _rebuild(self):
+        # Tool dicts come from the shared catalog cache and are referenced, not copied
+        tools = [
+            tool
+            for server_name, server_tools in self.tools_by_server.items()
+            for tool in server_tools
+            if self._routes.get(tool["name"]) == server_name
+        ]
+
+        tools.sort(key=lambda tool: tool["name"])
+        self.tools_by_name = {tool["name"]: tool for tool in tools}
+        self.tools = [tool for tool in tools if self._routes[tool["name"]] not in self.unavailable]
+        self.openai_schemas = [tool.get("openai_schema") or to_openai_schema(tool) for tool in self.tools]
+        self.version += 1
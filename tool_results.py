@@ -0,0 +1,220 @@
+import asyncio
+import base64
+import os
+import tempfile
+import time
+import uuid
+import weakref
+
+from history import count_tokens, truncate_to_tokens
+from metrics import logger
+
+# Where oversized tool payloads are written so the UI can attach them
+SPILL_DIR = os.path.join(tempfile.gettempdir(), "chainlit-tool-results")
+
+# Rough chars-per-token ratio used to size chunks without tokenizing everything
+CHARS_PER_TOKEN = 4
+
+# Tokens reserved per chunk summary for its "[Part i/n]" header and separator
+PART_OVERHEAD_TOKENS = 12
+
+# Map-reduce summaries of oversized results, by tool result object. The result
+# cache hands out the same object on every hit, so the summaries are reused
+# instead of summarizing again; an entry goes away with its result.
+_summaries = {}  # id(tool_result) -> (summary text, more content than chunks)
+
+
+class ProcessedResult:
+    """Prompt-ready view of a tool result plus anything the UI should attach"""
+
+    def __init__(self):
+        self.text = ""
+        self.total_tokens = 0
+        self.spill_path = None
+        self.images = []        # (mime type, raw bytes) pairs
+        self.summarized = False
+        self.truncated = False
+
+
+def _describe_item(item, images: list) -> str:
+    """Turn one MCP content item into prompt text, collecting images for the UI"""
+    item_type = getattr(item, "type", None)
+
+    if item_type == "text" or (item_type is None and hasattr(item, "text")):
+        return item.text
+
+    if item_type == "image":
+        try:
+            images.append((item.mimeType, base64.b64decode(item.data)))
+        except Exception:
+            pass
+        return f"[image: {item.mimeType}, {len(item.data) * 3 // 4} bytes, shown to the user]"
+
+    if item_type == "resource":
+        resource = item.resource
+        if getattr(resource, "text", None) is not None:
+            return f"[resource {resource.uri}]\n{resource.text}"
+        size = len(getattr(resource, "blob", "") or "") * 3 // 4
+        return f"[binary resource {resource.uri}: {getattr(resource, 'mimeType', None) or 'unknown type'}, {size} bytes]"
+
+    return str(item)
+
+
+def extract_result(tool_result, tool_name: str, max_tokens: int) -> ProcessedResult:
+    """Extract tool result content item by item, spilling to disk past `max_tokens`.
+
+    Items are inlined until the token cap is reached. From then on every item
+    is written straight to a spill file instead of being joined in memory, so
+    a multi-megabyte result is never held twice.
+    """
+    processed = ProcessedResult()
+
+    content = getattr(tool_result, "content", None)
+    if not content:
+        items = [str(tool_result)]
+    elif isinstance(content, list):
+        items = content
+    else:
+        items = [str(content)]
+
+    inline = []
+    spill = None
+    try:
+        for item in items:
+            text = item if isinstance(item, str) else _describe_item(item, processed.images)
+            remaining = max_tokens - processed.total_tokens
+            processed.total_tokens += count_tokens(text)
+
+            if spill is None and processed.total_tokens > max_tokens:
+                os.makedirs(SPILL_DIR, exist_ok=True)
+                safe_name = "".join(ch if ch.isalnum() or ch in "-_" else "_" for ch in tool_name)
+                processed.spill_path = os.path.join(SPILL_DIR, f"{safe_name}-{uuid.uuid4().hex[:12]}.txt")
+                spill = open(processed.spill_path, "w", encoding="utf-8")
+                spill.write("\n".join(inline))
+                # Keep the head of the item that crossed the cap in the prompt
+                if remaining > 0:
+                    inline.append(truncate_to_tokens(text, remaining))
+
+            if spill is not None:
+                spill.write("\n" + text)
+            else:
+                inline.append(text)
+    finally:
+        if spill is not None:
+            spill.close()
+
+    processed.text = "\n".join(inline)
+    return processed
+
+
+def discard_spill(path: str):
+    """Delete a spill file once it has been attached (Chainlit keeps its own copy)"""
+    if not path:
+        return
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def sweep_spill_dir(max_age: float):
+    """Delete spill files older than `max_age` seconds, e.g. left behind by a crashed worker"""
+    cutoff = time.time() - max_age
+    try:
+        entries = list(os.scandir(SPILL_DIR))
+    except OSError:
+        return
+    for entry in entries:
+        try:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+        except OSError:
+            pass
+
+
+def _remember_summary(tool_result, summary: tuple):
+    key = id(tool_result)
+    if key not in _summaries:
+        try:
+            weakref.finalize(tool_result, _summaries.pop, key, None)
+        except TypeError:  # not weak-referenceable, so it cannot be served again either
+            return
+    _summaries[key] = summary
+
+
+def _read_chunks(path: str, chunk_tokens: int, max_chunks: int) -> tuple[list, bool]:
+    """Read a spill file back in roughly `chunk_tokens`-sized chunks"""
+    chunks = []
+    with open(path, encoding="utf-8") as spill:
+        while len(chunks) < max_chunks:
+            chunk = spill.read(chunk_tokens * CHARS_PER_TOKEN)
+            if not chunk:
+                return chunks, False
+            chunks.append(chunk)
+        return chunks, bool(spill.read(1))
+
+
+async def process_tool_result(
+    tool_result,
+    tool_name: str,
+    max_tokens: int,
+    summarizer=None,
+    chunk_tokens: int = 4000,
+    max_chunks: int = 8
+) -> ProcessedResult:
+    """Bound a tool result to `max_tokens` for the synthesis prompt.
+
+    Small results are returned inline. Large ones are spilled to disk and,
+    when a `summarizer` (async callable taking tool name, chunk text and a
+    token budget) is given, map-reduce summarized with all chunks summarized
+    concurrently. Each chunk gets an equal share of `max_tokens`, so the
+    joined summaries fit without cutting off the last parts.
+    Summaries are reused when the same result object is processed again.
+    Without a summarizer, or if summarizing fails, the result is truncated.
+    The caller deletes the spill file with `discard_spill` once attached.
+    """
+    processed = await asyncio.to_thread(extract_result, tool_result, tool_name, max_tokens)
+    if processed.spill_path is None:
+        return processed
+
+    summary = _summaries.get(id(tool_result))
+    if summary is not None:
+        processed.text, processed.truncated = summary
+        processed.summarized = True
+    elif summarizer is not None:
+        try:
+            chunks, more = await asyncio.to_thread(_read_chunks, processed.spill_path, chunk_tokens, max_chunks)
+            budget = max(1, max_tokens // max(1, len(chunks)) - PART_OVERHEAD_TOKENS)
+            summaries = await asyncio.gather(*(summarizer(tool_name, chunk, budget) for chunk in chunks))
+            processed.text = "\n\n".join(
+                f"[Part {index + 1}/{len(chunks)}] {summary}" for index, summary in enumerate(summaries)
+            )
+            processed.summarized = True
+            processed.truncated = more
+            _remember_summary(tool_result, (processed.text, more))
+        except asyncio.CancelledError:
+            discard_spill(processed.spill_path)
+            raise
+        except Exception as e:
+            logger.error(f"Tool result summarization failed: {str(e)}")
+
+    if not processed.summarized:
+        processed.truncated = True
+    if count_tokens(processed.text) > max_tokens:
+        processed.text = truncate_to_tokens(processed.text, max_tokens)
+        processed.truncated = True
+    return processed
+
+
+def prompt_text(processed: ProcessedResult) -> str:
+    """Render a processed result for the model, noting any summarization or cuts"""
+    if processed.spill_path is None:
+        return processed.text
+
+    if processed.summarized:
+        note = f"The full result ({processed.total_tokens} tokens) was too large and is summarized below"
+    else:
+        note = f"The full result ({processed.total_tokens} tokens) was too large and is cut off below"
+    if processed.truncated:
+        note += "; some of it is omitted"
+    return f"{note}. The complete result is attached for the user as a file.\n\n{processed.text}"
@@ -0,0 +1,78 @@
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+
+from intent_router import tokenize
+
+
+class HashingEmbedder:
+    """Deterministic local text embedder (feature hashing of terms and term bigrams).
+
+    Needs no model or network, and gives the same vectors in every process,
+    so tool selection works offline and is reproducible. Any object with the
+    same `embed(texts) -> (len(texts), dim) float32 array of unit rows`
+    interface can replace it.
+    """
+
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+
+    def embed(self, texts: list) -> np.ndarray:
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            terms = tokenize(text)
+            for feature in terms + [f"{a} {b}" for a, b in zip(terms, terms[1:])]:
+                digest = hashlib.blake2b(feature.encode(), digest_size=8).digest()
+                bucket = int.from_bytes(digest[:4], "little") % self.dim
+                # A hashed sign keeps colliding features from always adding up
+                matrix[row, bucket] += 1.0 if digest[4] & 1 else -1.0
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+
+class ToolSelector:
+    """Top-k retrieval over a tool catalog, so the prompt only carries relevant tools.
+
+    Tool names and descriptions are embedded into a single matrix; each
+    message then costs one embedding and one matrix-vector product. Matrices
+    are shared by every session in the worker, keyed by a digest of the
+    embedded catalog, so a catalog is embedded once however many sessions
+    or catalog versions show it.
+    """
+
+    max_cached_catalogs = 32
+    _matrices = OrderedDict()  # (embedder class, dim, catalog digest) -> matrix
+
+    def __init__(self, tools: list, embedder=None, top_k: int = 12):
+        self.tools = tools
+        self.embedder = embedder or HashingEmbedder()
+        self.top_k = top_k
+        self.matrix = self._matrix(tools) if tools else None
+
+    def _matrix(self, tools: list) -> np.ndarray:
+        # Names are split into words by tokenize(); repeat them to outweigh long descriptions
+        documents = [f"{tool['name']} {tool['name']} {tool.get('description') or ''}" for tool in tools]
+        digest = hashlib.sha256("\x00".join(documents).encode()).hexdigest()
+        key = (type(self.embedder), getattr(self.embedder, "dim", None), digest)
+        matrix = self._matrices.get(key)
+        if matrix is None:
+            matrix = self.embedder.embed(documents)
+            matrix.flags.writeable = False
+            self._matrices[key] = matrix
+            while len(self._matrices) > self.max_cached_catalogs:
+                self._matrices.popitem(last=False)
+        else:
+            self._matrices.move_to_end(key)
+        return matrix
+
+    def select(self, message: str, always: list = None) -> list:
+        """The top-k tools for `message` (plus any in `always`), in catalog order"""
+        if len(self.tools) <= self.top_k:
+            return self.tools
+        query = self.embedder.embed([message])[0]
+        scores = self.matrix @ query
+        chosen = set(np.argpartition(-scores, self.top_k - 1)[:self.top_k].tolist())
+        names = set(always or [])
+        return [tool for index, tool in enumerate(self.tools) if index in chosen or tool["name"] in names]